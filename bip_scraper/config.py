@@ -1,14 +1,49 @@
 """Wczytanie konfiguracji z config.yaml."""
+import json
 from pathlib import Path
 
 import yaml
 
+try:
+    # Parser C (libyaml) – kilkukrotnie szybszy; używany przy braku/nieaktualnym cache
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+
+def _cache_path(path: Path) -> Path:
+    """Plik z kopią sparsowanej konfiguracji w JSON (obok config.yaml, ukryty)."""
+    return path.with_name(f".{path.name}.cache.json")
+
 
 def load_config(config_path: str | Path | None = None) -> dict:
+    """
+    Wczytuje config.yaml. Sparsowany wynik jest zapisywany obok jako JSON
+    i przy kolejnych uruchomieniach (np. z crona) czytany zamiast YAML-a,
+    dopóki mtime pliku YAML się nie zmieni.
+    """
     path = Path(config_path or "config.yaml")
     if not path.is_file():
         raise FileNotFoundError(
             f"Brak pliku konfiguracji: {path}. Skopiuj config.example.yaml do config.yaml."
         )
+    mtime_ns = path.stat().st_mtime_ns
+    cache = _cache_path(path)
+    try:
+        cached = json.loads(cache.read_bytes())
+        if cached.get("mtime_ns") == mtime_ns:
+            return cached["config"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
     with open(path, encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        config = yaml.load(f, Loader=_Loader)
+    try:
+        dumped = json.dumps({"mtime_ns": mtime_ns, "config": config}, ensure_ascii=False)
+        # Cache tylko gdy JSON wiernie odtwarza konfigurację (np. bez dat i kluczy liczbowych)
+        if json.loads(dumped)["config"] == config:
+            cache.write_text(dumped, encoding="utf-8")
+    except (OSError, TypeError, ValueError):
+        # System plików tylko do odczytu albo typy spoza JSON – działamy bez cache
+        pass
+    return config
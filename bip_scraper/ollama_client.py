@@ -2,112 +2,435 @@
 Klient Ollama (lokalnie) – analiza wpisów BIP przez Bielika
 i generowanie artykułu WordPress.
 """
-import json
-from typing import Any
+import hashlib
+import io
+import logging
+import os
+import random
+import re
+import shelve
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from string import Template
+from typing import Any, TextIO
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 from .scraper import BIPEntry
 
+logger = logging.getLogger(__name__)
 
-def _ollama_generate_legacy(base_url: str, model: str, prompt: str, system: str | None, stream: bool, timeout: int) -> str:
+
+# Wspólna sesja HTTP dla wszystkich wywołań Ollamy – połączenia keep-alive
+# są używane ponownie między partiami zamiast otwierania nowego TCP za każdym razem.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=0)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.headers.update({
+    "Connection": "keep-alive",
+    "Accept-Encoding": "gzip",
+    "Content-Type": "application/json",
+})
+
+
+def close_session() -> None:
+    """Zamyka połączenia współdzielonej sesji HTTP (np. przy zakończeniu programu)."""
+    _SESSION.close()
+
+
+class _Sink:
+    """Strumień wyjścia (plik, stdout) z informacją, czy coś już zapisano – wtedy nie ponawiamy zapytania."""
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.written = False
+
+    def write(self, text: str) -> None:
+        if not self.written:
+            # Odpowiednik strip() z trybu buforowanego – bez białych znaków na początku
+            text = text.lstrip()
+            if not text:
+                return
+            self.written = True
+        self.stream.write(text)
+
+
+def _collect_stream(r: requests.Response, field: str, sink: _Sink | None = None) -> str:
+    """
+    Skleja odpowiedź strumieniową Ollamy (NDJSON, jedna linia = jeden fragment).
+    `field` to "response" dla /api/generate albo "message" dla /api/chat.
+    Kończy czytanie na fragmencie z `done: true`.
+    Z `sink` fragmenty są od razu zapisywane do niego (bez sklejania w pamięci), a wynik to "".
+    """
+    parts: list[str] = []
+    try:
+        for line in r.iter_lines():
+            if not line:
+                continue
+            chunk = orjson.loads(line)
+            if chunk.get("error"):
+                raise requests.exceptions.RequestException(f"Ollama: {chunk['error']}", response=r)
+            value = chunk.get(field) or ""
+            if isinstance(value, dict):
+                value = value.get("content") or ""
+            if sink is not None:
+                if value:
+                    sink.write(value)
+            else:
+                parts.append(value)
+            if chunk.get("done"):
+                break
+    finally:
+        r.close()
+    return "".join(parts).strip()
+
+
+def _ollama_generate_legacy(
+    base_url: str,
+    model: str,
+    prompt: str,
+    system: str | None,
+    stream: bool,
+    timeout: float | tuple[float, float],
+    options: dict[str, Any],
+    keep_alive: str | int = "30m",
+    sink: _Sink | None = None,
+) -> str:
     """POST /api/generate (klasyczne API Ollama)."""
     root = base_url.rstrip("/")
     payload: dict[str, Any] = {
         "model": model, 
         "prompt": prompt, 
         "stream": stream,
-        "options": {
-            "num_ctx": 16384
-        }
+        "keep_alive": keep_alive,
+        "options": options,
     }
     if system:
         payload["system"] = system
-    r = requests.post(f"{root}/api/generate", json=payload, timeout=timeout)
+    r = _SESSION.post(f"{root}/api/generate", data=orjson.dumps(payload), timeout=timeout, stream=stream)
     r.raise_for_status()
-    return (r.json().get("response") or "").strip()
+    if stream:
+        return _collect_stream(r, "response", sink)
+    return (orjson.loads(r.content).get("response") or "").strip()
 
 
-def _ollama_chat(base_url: str, model: str, prompt: str, system: str | None, stream: bool, timeout: int) -> str:
+def _ollama_chat(
+    base_url: str,
+    model: str,
+    prompt: str,
+    system: str | None,
+    stream: bool,
+    timeout: float | tuple[float, float],
+    options: dict[str, Any],
+    keep_alive: str | int = "30m",
+    sink: _Sink | None = None,
+) -> str:
     """POST /api/chat (API czatu – fallback gdy /api/generate zwraca 404)."""
     root = base_url.rstrip("/")
     messages: list[dict[str, str]] = []
     if system:
         messages.append({"role": "system", "content": system})
     messages.append({"role": "user", "content": prompt})
-    r = requests.post(
-        f"{root}/api/chat",
-        json={
-            "model": model, 
-            "messages": messages, 
-            "stream": stream,
-            "options": {
-                "num_ctx": 16384
-            }
-        },
-        timeout=timeout,
-    )
+    payload: dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "stream": stream,
+        "keep_alive": keep_alive,
+        "options": options,
+    }
+    r = _SESSION.post(f"{root}/api/chat", data=orjson.dumps(payload), timeout=timeout, stream=stream)
     r.raise_for_status()
-    msg = r.json().get("message") or {}
+    if stream:
+        return _collect_stream(r, "message", sink)
+    msg = orjson.loads(r.content).get("message") or {}
     return (msg.get("content") or "").strip()
 
 
-def ollama_generate(
+# Dostępne rozmiary okna kontekstu – zaokrąglamy w górę do progu, żeby kolejne
+# wywołania tego samego etapu miały zwykle ten sam num_ctx (zmiana wymusza przeładowanie modelu).
+# Najmniejszy próg to 4096: sam zapas na odpowiedź i szablon (2048 + 512) przekracza 2048.
+_NUM_CTX_OUTPUT_RESERVE = 2048
+_NUM_CTX_TEMPLATE_OVERHEAD = 512
+_NUM_CTX_STEPS = (4096, 8192, 16384)
+
+
+def fit_num_ctx(*texts: str | None) -> int:
+    """
+    Dobiera num_ctx do długości promptu: ~3 znaki na token (heurystyka dla polskiego)
+    + zapas na odpowiedź i narzut szablonu, zaokrąglone do _NUM_CTX_STEPS (max 16384).
+    """
+    tokens = sum(len(t) for t in texts if t) // 3 + _NUM_CTX_OUTPUT_RESERVE + _NUM_CTX_TEMPLATE_OVERHEAD
+    for step in _NUM_CTX_STEPS:
+        if tokens <= step:
+            return step
+    return _NUM_CTX_STEPS[-1]
+
+
+def _ollama_generate_uncached(
     base_url: str,
     model: str,
     prompt: str,
-    *,
-    system: str | None = None,
-    stream: bool = False,
-    timeout: int = 300,
+    system: str | None,
+    stream: bool,
+    timeout: float | tuple[float, float],
+    options: dict[str, Any],
+    keep_alive: str | int,
+    sink: _Sink | None = None,
 ) -> str:
-    """
-    Wywołuje model przez API Ollama. Próbuje /api/generate,
-    przy 404 używa /api/chat (niektóre instalacje/proxy mają tylko chat).
-    """
+    """/api/generate z fallbackiem na /api/chat przy 404."""
     try:
-        return _ollama_generate_legacy(base_url, model, prompt, system, stream, timeout)
+        return _ollama_generate_legacy(base_url, model, prompt, system, stream, timeout, options, keep_alive, sink)
     except requests.exceptions.HTTPError as e:
         if e.response is not None and e.response.status_code == 404:
             # Log the error from /api/generate (e.g., "model not found")
             try:
                 err_msg = e.response.json().get("error", e.response.text)
-                print(f"WARN: /api/generate returned 404: {err_msg}. Trying /api/chat fallback...", file=sys.stderr)
+                logger.warning("/api/generate returned 404: %s. Trying /api/chat fallback...", err_msg)
             except Exception:
-                print(f"WARN: /api/generate returned 404. Trying /api/chat fallback...", file=sys.stderr)
+                logger.warning("/api/generate returned 404. Trying /api/chat fallback...")
             
-            return _ollama_chat(base_url, model, prompt, system, stream, timeout)
+            return _ollama_chat(base_url, model, prompt, system, stream, timeout, options, keep_alive, sink)
         
         # Re-raise other errors (500, etc.)
         if e.response is not None:
-             print(f"ERROR: Ollama API returned {e.response.status_code}: {e.response.text}", file=sys.stderr)
+             logger.error("Ollama API returned %d: %s", e.response.status_code, e.response.text)
         raise
 
 
-def entries_to_text(entries: list[BIPEntry], max_title_len: int = 120) -> str:
-    """Formatuje listę wpisów do czytelnego tekstu dla modelu."""
-    lines = []
+# Ponawianie przy przejściowych błędach (restart Ollamy, 502 z reverse proxy)
+_RETRY_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 2.0
+_RETRY_MAX_DELAY = 10.0
+_RETRY_STATUSES = {502, 503, 504}
+
+
+def _is_transient(e: requests.exceptions.RequestException) -> bool:
+    """Błąd połączenia, zerwany strumień albo 502/503/504 – warto ponowić. 404/400/500 – nie."""
+    if isinstance(e, requests.exceptions.HTTPError):
+        return e.response is not None and e.response.status_code in _RETRY_STATUSES
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError))
+
+
+def _cache_file(
+    model: str, system: str | None, prompt: str, num_ctx: int, options: dict[str, Any] | None = None
+) -> Path | None:
+    """
+    Plik cache odpowiedzi dla danego zapytania – tylko przy BIP_OLLAMA_CACHE=1.
+    Katalog: BIP_OLLAMA_CACHE_DIR (domyślnie ~/.cache/bip-scraper/ollama).
+    """
+    if os.getenv("BIP_OLLAMA_CACHE") != "1":
+        return None
+    root = Path(os.getenv("BIP_OLLAMA_CACHE_DIR") or "~/.cache/bip-scraper/ollama").expanduser()
+    raw = f"{model}|{system}|{prompt}|{num_ctx}".encode("utf-8")
+    if options:
+        raw += b"|" + orjson.dumps(options, option=orjson.OPT_SORT_KEYS)
+    key = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    return root / f"{key}.txt"
+
+
+def _cache_store(path: Path, text: str) -> None:
+    """Zapisuje odpowiedź atomowo (plik tymczasowy + rename); błędy zapisu tylko logujemy."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, delete=False) as f:
+            f.write(text)
+        os.replace(f.name, path)
+    except OSError as e:
+        logger.warning("Nie udało się zapisać cache Ollamy %s: %s", path, e)
+
+
+def ollama_generate(
+    base_url: str,
+    model: str,
+    prompt: str,
+    *,
+    system: str | None = None,
+    stream: bool = True,
+    timeout: int = 300,
+    connect_timeout: float = 5,
+    num_ctx: int | None = None,
+    keep_alive: str | int = "30m",
+    sink: TextIO | None = None,
+    options: dict[str, Any] | None = None,
+) -> str:
+    """
+    Wywołuje model przez API Ollama. Próbuje /api/generate,
+    przy 404 używa /api/chat (niektóre instalacje/proxy mają tylko chat).
+    Domyślnie odbiera odpowiedź strumieniowo: fragmenty są sklejane na bieżąco,
+    a timeout dotyczy przerwy między fragmentami, nie całego generowania.
+    `num_ctx` domyślnie dobierany do promptu (fit_num_ctx) zamiast stałych 16384.
+    Nawiązanie połączenia ma osobny, krótki limit (`connect_timeout`), więc
+    niedziałająca Ollama kończy wywołanie po sekundach, a nie po `timeout`.
+    `keep_alive` mówi Ollamie, jak długo trzymać model w pamięci po zapytaniu
+    (domyślne 5 min serwera to przeładowanie modelu przy dłuższych przerwach).
+
+    Przy promptcie systemowym ustawiane jest `num_keep` (przybliżona liczba jego
+    tokenów), żeby przy przesuwaniu okna kontekstu Ollama zachowywała instrukcje
+    systemowe zamiast je obcinać i liczyć od nowa.
+
+    Błędy przejściowe (zerwane połączenie, 502/503/504) są ponawiane do
+    _RETRY_ATTEMPTS razy z wykładniczym opóźnieniem i losowym jitterem.
+
+    Przy BIP_OLLAMA_CACHE=1 odpowiedzi są zapamiętywane na dysku (klucz: model,
+    system, prompt, num_ctx), więc powtórzone uruchomienie nie woła modelu ponownie.
+
+    `options` (ollama.options z configu: num_ctx, num_batch, num_thread, num_predict,
+    temperature...) trafiają do zapytania bez zmian; podany w nich num_ctx zastępuje
+    dobierany automatycznie – stały rozmiar KV cache między uruchomieniami.
+
+    Z `sink` (plik tekstowy, stdout) odpowiedź jest zapisywana do niego fragment po
+    fragmencie i nie jest trzymana w pamięci – funkcja zwraca wtedy "". Ponowienie
+    jest możliwe tylko, dopóki nic nie zapisano; w tym trybie odpowiedź nie trafia do cache.
+    """
+    num_ctx = num_ctx or (options or {}).get("num_ctx") or fit_num_ctx(system, prompt)
+    cache = _cache_file(model, system, prompt, num_ctx, options)
+    if cache is not None and cache.is_file():
+        if sink is not None:
+            sink.write(cache.read_text(encoding="utf-8"))
+            return ""
+        return cache.read_text(encoding="utf-8")
+    tracked = _Sink(sink) if sink is not None else None
+    request_options: dict[str, Any] = {"num_ctx": num_ctx}
+    if system:
+        request_options["num_keep"] = len(system) // 3
+    if options:
+        request_options.update(options, num_ctx=num_ctx)
+    for attempt in range(1, _RETRY_ATTEMPTS + 1):
+        try:
+            response = _ollama_generate_uncached(
+                base_url, model, prompt, system, stream or tracked is not None, (connect_timeout, timeout),
+                request_options, keep_alive, tracked,
+            )
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == _RETRY_ATTEMPTS or not _is_transient(e) or (tracked is not None and tracked.written):
+                raise
+            delay = min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** (attempt - 1)) + random.random()
+            logger.warning("Ollama – błąd przejściowy (%s), ponowienie %d/%d za %.1f s", e, attempt, _RETRY_ATTEMPTS - 1, delay)
+            time.sleep(delay)
+    if cache is not None and response:
+        _cache_store(cache, response)
+    return response
+
+
+def warm_up_model(
+    base_url: str,
+    model: str,
+    keep_alive: str | int = "30m",
+    timeout: int = 60,
+    options: dict[str, Any] | None = None,
+    num_ctx: int | None = None,
+) -> None:
+    """
+    Ładuje model do pamięci Ollamy z góry (zapytanie bez promptu), żeby pierwsza
+    partia nie czekała na zimny start. Błąd rozgrzewki tylko logujemy.
+    Model jest ładowany z `options` i `num_ctx` (ma pierwszeństwo) – muszą być takie
+    jak we właściwych zapytaniach, inaczej pierwsze z nich wymusi przeładowanie
+    z innym rozmiarem kontekstu.
+    """
+    root = base_url.rstrip("/")
+    payload: dict[str, Any] = {"model": model, "keep_alive": keep_alive, "stream": False}
+    if num_ctx:
+        options = {**(options or {}), "num_ctx": num_ctx}
+    if options:
+        payload["options"] = options
+    try:
+        r = _SESSION.post(f"{root}/api/generate", data=orjson.dumps(payload), timeout=(5, timeout))
+        r.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning("Rozgrzewka modelu %s nie powiodła się: %s", model, e)
+
+
+_NON_WS = re.compile(r"\S+")
+
+
+def _truncate_ws(text: str, limit: int = 800) -> str:
+    """
+    Odpowiednik `" ".join(text.split())[:limit]`, ale czyta tekst tylko do
+    zebrania `limit` znaków – bez normalizowania całego (nawet wielo-MB) załącznika.
+    """
+    words: list[str] = []
+    size = -1
+    for m in _NON_WS.finditer(text):
+        words.append(m.group())
+        size += len(words[-1]) + 1
+        if size >= limit:
+            break
+    return " ".join(words)[:limit]
+
+
+# Zdania z konkretami: kwoty/liczby, daty, złotówki, działki, ulice, terminy
+_FACT_RE = re.compile(
+    r"\d{1,3}[\s.]?\d{3}|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}|\bzł\b|\bdziałk|\bul\.\s|\btermin",
+    re.I,
+)
+# Granica zdania: znak końca zdania i odstęp przed czymś, co nie zaczyna się małą literą
+# (z pominięciem skrótów ul., nr., al., pl., art., ust., pkt.) albo pusta linia
+_SENTENCE_END_RE = re.compile(
+    r"(?<=[.!?])(?<!\bul\.)(?<!\bnr\.)(?<!\bal\.)(?<!\bpl\.)(?<!\bart\.)(?<!\bust\.)(?<!\bpkt\.)"
+    r"\s+(?![a-ząćęłńóśźż])|\n\s*\n"
+)
+
+
+def _compress_snippet(text: str, max_chars: int = 300) -> str:
+    """
+    Ekstrakcyjne skrócenie treści załącznika: zostawia (w kolejności) zdania
+    zawierające daty, kwoty, numery działek, ulice lub terminy, do `max_chars`
+    znaków. Gdy takich zdań nie ma – początek tekstu jak w _truncate_ws.
+    """
+    picked: list[str] = []
+    size = -1
+    for sentence in _SENTENCE_END_RE.split(text):
+        if not _FACT_RE.search(sentence):
+            continue
+        sentence = _truncate_ws(sentence, max_chars)
+        picked.append(sentence)
+        size += len(sentence) + 1
+        if size >= max_chars:
+            break
+    if not picked:
+        return _truncate_ws(text, max_chars)
+    return " ".join(picked)[:max_chars]
+
+
+def _entry_text(e: BIPEntry, max_title_len: int = 120) -> str:
+    """Tekst jednego wpisu dla modelu (bez numeru na liście – ten dokłada entries_to_text)."""
+    title = (e.title[: max_title_len] + "...") if len(e.title) > max_title_len else e.title
+    data = f"   Data: {e.published}\n" if e.published else ""
+    skrot = f"   Skrót: {e.summary[:200]}...\n" if e.summary else ""
+    zalaczniki = ""
+    if e.attachments:
+        # Z treści załącznika zostają zdania z konkretami (max 300 znaków), by nie przepełnić promptu
+        snippets = ((att.get("name", "Plik"), _compress_snippet(att.get("text_content") or "")) for att in e.attachments)
+        zalaczniki = "   ZAŁĄCZNIKI (PDF):\n" + "".join(
+            f"     -> {name}: {snippet}...\n" for name, snippet in snippets if snippet
+        )
+    return f"[{title}]\n   Źródło: {e.source_name}\n   URL: {e.url}\n{data}{skrot}{zalaczniki}"
+
+
+def entries_to_text(
+    entries: list[BIPEntry],
+    max_title_len: int = 120,
+    texts: dict[int, str] | None = None,
+) -> str:
+    """
+    Formatuje listę wpisów do czytelnego tekstu dla modelu.
+    `texts` – gotowe teksty wpisów (_entry_text, klucz id(wpisu)), np. z _pack_chunks – bez ponownego formatowania.
+    """
+    out = io.StringIO()
     for i, e in enumerate(entries, 1):
-        title = (e.title[: max_title_len] + "...") if len(e.title) > max_title_len else e.title
-        lines.append(f"{i}. [{title}]\n   Źródło: {e.source_name}\n   URL: {e.url}")
-        if e.published:
-            lines.append(f"   Data: {e.published}")
-        if e.summary:
-            lines.append(f"   Skrót: {e.summary[:200]}...")
-        
-        if e.attachments:
-            lines.append("   ZAŁĄCZNIKI (PDF):")
-            for att in e.attachments:
-                name = att.get("name", "Plik")
-                # Skracamy treść załącznika, by nie przepełnić promptu
-                content = (att.get("text_content") or "").strip()
-                if content:
-                    # Wycinamy białe znaki i bierzemy fragment
-                    snippet = " ".join(content.split())[:800]
-                    lines.append(f"     -> {name}: {snippet}...")
-        
-        lines.append("")
-    return "\n".join(lines)
+        if i > 1:
+            out.write("\n")
+        text = texts.get(id(e)) if texts else None
+        out.write(f"{i}. {text if text is not None else _entry_text(e, max_title_len)}")
+    return out.getvalue()
 
 
 SYSTEM_ANALIZA = """Jesteś ekspertem od informacji publicznych (BIP). Twoim zadaniem jest wybór informacji istotnych dla mieszkańców powiatu (gminy, miasta). 
@@ -115,7 +438,7 @@ Opieraj się WYŁĄCZNIE na dostarczonym tekście, w tym na treści ZAŁĄCZNIK
 Zwracaj uwagę na: uchwały i zarządzenia wpływające na codzienne życie, przetargi i zamówienia publiczne (szczegóły w załącznikach), konsultacje społeczne, obwieszczenia, zmiany w prawie miejscowym.
 Pomijaj wewnętrzne procedury, czysto techniczne zmiany i powtórzenia."""
 
-PROMPT_ANALIZA = """Poniżej lista wpisów z rejestrów zmian kilku BIP-ów. Część wpisów zawiera sekcję "ZAŁĄCZNIKI (PDF)" z wyciągniętą treścią dokumentów.
+PROMPT_ANALIZA = Template("""Poniżej lista wpisów z rejestrów zmian kilku BIP-ów. Część wpisów zawiera sekcję "ZAŁĄCZNIKI (PDF)" z wyciągniętą treścią dokumentów.
 
 Przeanalizuj dokładnie tytuły oraz treść załączników. Wybierz te wpisy, które są ważne dla mieszkańców (np. inwestycje, podatki, utrudnienia, ważne terminy).
 
@@ -127,15 +450,15 @@ Dla każdego wybranego wpisu podaj:
 Jeśli wpis jest techniczną zmianą w BIP bez znaczenia dla ogółu -> POMIŃ GO.
 
 ---
-{tekst_wpisow}
+$tekst_wpisow
 ---
-Odpowiedz w formie listy punktowanej. Pisz zwięźle i konkretnie. Nie halucynuj."""
+Odpowiedz w formie listy punktowanej. Pisz zwięźle i konkretnie. Nie halucynuj.""")
 
 SYSTEM_ARTYKUL = """Jesteś rzetelnym dziennikarzem lokalnym. Piszesz artykuł na podstawie dostarczonej analizy. 
 Twoim priorytetem jest prawda i konkret. Nie dodawaj "upiększaczy" ani zmyślonych opinii mieszkańców. 
 Opieraj się na faktach z analizy (daty, nazwy, kwoty). Styl: informacyjny, prosty, zrozumiały."""
 
-PROMPT_ARTYKUL = """Na podstawie poniższej analizy wpisów z BIP przygotuj artykuł do publikacji.
+PROMPT_ARTYKUL = Template("""Na podstawie poniższej analizy wpisów z BIP przygotuj artykuł do publikacji.
 
 Struktura:
 1. Chwytliwy, ale prawdziwy tytuł.
@@ -151,14 +474,224 @@ Format HTML (używaj <h3> dla nagłówków sekcji, <p> dla treści, <ul>/<li> dl
 
 ---
 ANALIZA WPISÓW:
-{tekst_analizy}
+$tekst_analizy
+---
+Generuj artykuł.""")
+
+
+def chunk_entries(entries: list[BIPEntry], chunk_size: int, stride: int | None = None) -> list[list[BIPEntry]]:
+    """
+    Dzieli listę wpisów na mniejsze fragmenty (batche).
+    `stride` < `chunk_size` daje okno przesuwne: sąsiednie partie dzielą
+    `chunk_size - stride` wpisów, więc wpis z granicy nie traci kontekstu.
+    Domyślnie `stride = chunk_size` (partie rozłączne).
+    """
+    if not entries:
+        return []
+    stride = stride or chunk_size
+    end = max(1, len(entries) - chunk_size + stride)
+    return [entries[i : i + chunk_size] for i in range(0, end, stride)]
+
+
+def _num_parallel() -> int:
+    """Liczba równoległych zapytań do Ollamy (zmienna OLLAMA_NUM_PARALLEL, domyślnie 4)."""
+    try:
+        return max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+    except ValueError:
+        return 4
+
+
+def _generate_batches(
+    batches: list[list[BIPEntry]],
+    prompt_template: Template,
+    system: str,
+    label: str,
+    warm_up: bool = False,
+    texts: dict[int, str] | None = None,
+    **generate_kwargs: Any,
+) -> list[str | Exception]:
+    """
+    Wysyła partie do Ollamy równolegle (pula wątków o rozmiarze OLLAMA_NUM_PARALLEL).
+    Cały etap dostaje jeden num_ctx dopasowany do najdłuższego promptu, żeby
+    Ollama nie przeładowywała modelu między partiami.
+    Z `warm_up` model jest najpierw ładowany (warm_up_model) z tym samym num_ctx.
+    `texts` – gotowe teksty wpisów dla entries_to_text.
+    Zwraca wyniki w kolejności partii; dla nieudanej partii – złapany wyjątek.
+    """
+    prompts = [prompt_template.substitute(tekst_wpisow=entries_to_text(batch, texts=texts)) for batch in batches]
+    if not (generate_kwargs.get("options") or {}).get("num_ctx"):
+        # Przypięty ollama.options.num_ctx ma pierwszeństwo przed dopasowaniem
+        generate_kwargs.setdefault("num_ctx", max((fit_num_ctx(system, p) for p in prompts), default=None))
+    if warm_up and prompts:
+        warm_up_model(
+            generate_kwargs["base_url"],
+            generate_kwargs["model"],
+            keep_alive=generate_kwargs.get("keep_alive", "30m"),
+            options=generate_kwargs.get("options"),
+            num_ctx=generate_kwargs.get("num_ctx"),
+        )
+
+    def run(item: tuple[int, str]) -> str | Exception:
+        i, prompt = item
+        logger.info("  -> %s części %d/%d...", label, i, len(batches))
+        try:
+            return ollama_generate(prompt=prompt, system=system, **generate_kwargs)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=_num_parallel()) as executor:
+        return list(executor.map(run, enumerate(prompts, 1)))
+
+
+class StageFailedError(requests.exceptions.RequestException):
+    """Żadna partia etapu się nie powiodła (np. Ollama niedostępna) – etap nie ma wyniku."""
+
+
+def _raise_if_all_failed(results: list[str | Exception], label: str) -> None:
+    """StageFailedError, gdy wszystkie wyniki partii to wyjątki; odpowiedź HTTP pierwszego błędu jest zachowana."""
+    if results and all(isinstance(r, Exception) for r in results):
+        first = results[0]
+        raise StageFailedError(
+            f"{label}: żadna z {len(results)} części się nie powiodła ({first})",
+            response=getattr(first, "response", None),
+        )
+
+
+def _is_server_error(result: str | Exception) -> bool:
+    """
+    Czy partia padła na błędzie 500 samej Ollamy (np. przepełniony kontekst, brak pamięci na GPU).
+    502/503/504 (Ollama lub proxy niedostępne) ponawia już ollama_generate – dzielenie partii
+    tylko mnożyłoby zapytania do niedziałającego serwera.
+    """
+    return (
+        isinstance(result, requests.exceptions.HTTPError)
+        and result.response is not None
+        and result.response.status_code == 500
+    )
+
+
+def _generate_batches_adaptive(
+    batches: list[list[BIPEntry]],
+    prompt_template: Template,
+    system: str,
+    label: str,
+    warm_up: bool = False,
+    texts: dict[int, str] | None = None,
+    **generate_kwargs: Any,
+) -> tuple[list[list[BIPEntry]], list[str | Exception]]:
+    """
+    Jak _generate_batches, ale partia odrzucona przez serwer (500 – zwykle za długi
+    prompt) jest dzielona na pół i wysyłana ponownie, aż do pojedynczych wpisów.
+    Pozwala używać dużych partii (mniej zapytań) bez ryzyka utraty całej partii.
+    Num_ctx etapu jest dopasowany raz, do pierwotnych partii, i dostają go też ponowienia
+    (krótsze prompty połówek dopasowałyby mniejszy i Ollama przeładowałaby model w trakcie etapu).
+    Zwraca ostateczne partie i ich wyniki, w kolejności wpisów.
+    """
+    if batches and not (generate_kwargs.get("options") or {}).get("num_ctx"):
+        # Teksty wpisów formatowane raz – dla dopasowania num_ctx, zapytań i ponowień
+        if texts is None:
+            texts = {id(e): _entry_text(e) for batch in batches for e in batch}
+        generate_kwargs.setdefault(
+            "num_ctx",
+            max(
+                fit_num_ctx(system, prompt_template.substitute(tekst_wpisow=entries_to_text(batch, texts=texts)))
+                for batch in batches
+            ),
+        )
+    results = _generate_batches(batches, prompt_template, system, label, warm_up, texts, **generate_kwargs)
+    while True:
+        failed = [i for i, r in enumerate(results) if _is_server_error(r) and len(batches[i]) > 1]
+        if not failed:
+            return batches, results
+        logger.info("  -> %d części odrzuconych przez serwer – dzielę je na pół i ponawiam...", len(failed))
+        halves = []
+        for i in failed:
+            mid = len(batches[i]) // 2
+            halves += [batches[i][:mid], batches[i][mid:]]
+        retried = iter(_generate_batches(halves, prompt_template, system, label, texts=texts, **generate_kwargs))
+        new_batches: list[list[BIPEntry]] = []
+        new_results: list[str | Exception] = []
+        halves_iter = iter(halves)
+        failed_set = set(failed)
+        for i, (batch, result) in enumerate(zip(batches, results)):
+            if i in failed_set:
+                for _ in range(2):
+                    new_batches.append(next(halves_iter))
+                    new_results.append(next(retried))
+            else:
+                new_batches.append(batch)
+                new_results.append(result)
+        batches, results = new_batches, new_results
+
+
+# Sygnały, że wpis może dotyczyć mieszkańców – partie bez żadnego trafienia
+# są pomijane bez wysyłania do modelu (same wewnętrzne/techniczne zmiany).
+_RESIDENTS_RE = re.compile(
+    r"\b(przetarg|uchwał|zarządzen|konsultac|obwieszcz|nabór|inwestyc|budżet)",
+    re.I,
+)
+
+
+def _is_relevant(entry: BIPEntry) -> bool:
+    """Czy wpis (tytuł, skrót, treść lub załączniki) zawiera którykolwiek z sygnałów _RESIDENTS_RE."""
+    return bool(
+        _RESIDENTS_RE.search(entry.title)
+        or _RESIDENTS_RE.search(entry.summary or "")
+        or _RESIDENTS_RE.search(entry.content or "")
+        or any(_RESIDENTS_RE.search(att.get("text_content") or "") for att in entry.attachments)
+    )
+
+
+SYSTEM_REDUKCJA = """Łączysz analizy wpisów z BIP w jedną. Zachowujesz wszystkie konkretne fakty
+(daty, kwoty, numery, nazwy, linki URL), usuwasz powtórzenia. Nie dodajesz niczego spoza analiz."""
+
+PROMPT_REDUKCJA = Template("""Połącz poniższe dwie analizy w jedną listę punktowaną, usuwając duplikaty.
+Każdy temat ma wystąpić raz, ze wszystkimi szczegółami i linkiem do BIP.
+
+--- ANALIZA A ---
+$analiza_a
+--- ANALIZA B ---
+$analiza_b
 ---
-Generuj artykuł."""
+Odpowiedz tylko połączoną listą.""")
 
 
-def chunk_entries(entries: list[BIPEntry], chunk_size: int) -> list[list[BIPEntry]]:
-    """Dzieli listę wpisów na mniejsze fragmenty (batche)."""
-    return [entries[i : i + chunk_size] for i in range(0, len(entries), chunk_size)]
+def _tree_reduce(analyses: list[str], **generate_kwargs: Any) -> str:
+    """
+    Redukcja drzewiasta: łączy sąsiednie pary analiz wywołaniem modelu
+    (pary danego poziomu równolegle), aż zostanie jedna – głębokość log2(N).
+    Gdy połączenie pary się nie uda, para zostaje sklejona tekstowo.
+    Bez przypiętego num_ctx cały poziom dostaje jeden, dopasowany do najdłuższej pary
+    (i nie mniejszy niż na poprzednim poziomie) – model nie jest przeładowywany między parami.
+    """
+    pinned = bool((generate_kwargs.get("options") or {}).get("num_ctx"))
+    num_ctx = 0
+    level = 0
+    while len(analyses) > 1:
+        level += 1
+        pairs = [analyses[i : i + 2] for i in range(0, len(analyses), 2)]
+        logger.info("  -> Redukcja poziom %d: %d -> %d...", level, len(analyses), len(pairs))
+        prompts = [
+            PROMPT_REDUKCJA.substitute(analiza_a=pair[0], analiza_b=pair[1]) if len(pair) == 2 else None
+            for pair in pairs
+        ]
+        if not pinned:
+            num_ctx = max([num_ctx] + [fit_num_ctx(SYSTEM_REDUKCJA, p) for p in prompts if p])
+            generate_kwargs["num_ctx"] = num_ctx
+
+        def merge(item: tuple[list[str], str | None]) -> str:
+            pair, prompt = item
+            if prompt is None:
+                return pair[0]
+            try:
+                return ollama_generate(prompt=prompt, system=SYSTEM_REDUKCJA, **generate_kwargs)
+            except Exception as e:
+                logger.error("Błąd redukcji (poziom %d): %s", level, e)
+                return "\n\n".join(pair)
+
+        with ThreadPoolExecutor(max_workers=_num_parallel()) as executor:
+            analyses = list(executor.map(merge, zip(pairs, prompts)))
+    return analyses[0] if analyses else ""
 
 
 def analyze_for_residents(
@@ -167,35 +700,72 @@ def analyze_for_residents(
     model: str = "SpeakLeash/bielik-11b-v2.3-instruct:Q4_K_M",
     timeout: int = 300,
     chunk_size: int = 5,
+    stride: int | None = None,
+    tree_reduce: bool = False,
+    keep_alive: str | int = "30m",
+    options: dict[str, Any] | None = None,
+    errors: list[Exception] | None = None,
 ) -> str:
     """
     Wysyła listę wpisów BIP do Bielika w partiach (batchach),
     aby nie przekroczyć okna kontekstowego (Map).
-    Następnie łączy wyniki (Reduce).
+    Następnie łączy wyniki (Reduce): domyślnie sklejając części, a przy
+    `tree_reduce=True` – parami przez model (_tree_reduce), co daje jedną
+    analizę bez powtórzeń i krótszy prompt dla generate_wordpress_article.
+    `stride` pozwala na nakładające się partie (zob. chunk_entries).
+
+    Partie bez żadnego sygnału istotności (_RESIDENTS_RE: przetarg, uchwała,
+    konsultacje...) są pomijane bez wywołania modelu; gdy nie zostaje żadna,
+    zwracany jest pusty tekst. Gdy nie powiedzie się żadna z wysłanych partii,
+    rzucany jest StageFailedError (awaria Ollamy to nie „brak istotnych wpisów”).
+    Wyjątki pojedynczych nieudanych partii trafiają do listy `errors` (gdy podana) –
+    wynik jest wtedy niepełny i nie powinien trafić do cache artykułów.
+
+    Partie są wysyłane równolegle – liczba jednoczesnych zapytań odpowiada
+    zmiennej OLLAMA_NUM_PARALLEL (domyślnie 4), tej samej, którą ustawia się
+    serwerowi Ollama. Kolejność części w wyniku jest zachowana.
+    `options` – opcje modelu Ollamy (zob. ollama_generate) dla wszystkich zapytań etapu.
     """
-    batches = chunk_entries(entries, chunk_size)
-    combined_analysis = []
-    
-    print(f"Analiza w {len(batches)} częściach (po max {chunk_size} wpisów)...")
+    batches = chunk_entries(entries, chunk_size, stride)
+    relevant = [batch for batch in batches if any(_is_relevant(e) for e in batch)]
+    if len(relevant) < len(batches):
+        logger.info("Pominięto %d części bez wpisów istotnych dla mieszkańców.", len(batches) - len(relevant))
+        batches = relevant
+    if not batches:
+        return ""
+    logger.info("Analiza w %d częściach (po max %d wpisów, równolegle %d)...", len(batches), chunk_size, _num_parallel())
 
-    for i, batch in enumerate(batches, 1):
-        print(f"  -> Przetwarzanie części {i}/{len(batches)}...")
-        tekst = entries_to_text(batch)
-        prompt = PROMPT_ANALIZA.format(tekst_wpisow=tekst)
-        
-        try:
-            response = ollama_generate(
-                base_url,
-                model,
-                prompt,
-                system=SYSTEM_ANALIZA,
-                stream=False,
-                timeout=timeout,
-            )
-            combined_analysis.append(f"--- CZĘŚĆ {i} ---\n{response}")
-        except Exception as e:
-            print(f"Błąd analizy części {i}: {e}")
+    results = _generate_batches(
+        batches,
+        PROMPT_ANALIZA,
+        SYSTEM_ANALIZA,
+        "Przetwarzanie",
+        warm_up=True,
+        base_url=base_url,
+        model=model,
+        timeout=timeout,
+        keep_alive=keep_alive,
+        options=options,
+    )
+    _raise_if_all_failed(results, "Analiza")
+    if errors is not None:
+        errors.extend(r for r in results if isinstance(r, Exception))
+    if tree_reduce:
+        for i, result in enumerate(results, 1):
+            if isinstance(result, Exception):
+                logger.error("Błąd analizy części %d: %s", i, result)
+        analyses = [r for r in results if not isinstance(r, Exception)]
+        return _tree_reduce(
+            analyses, base_url=base_url, model=model, timeout=timeout, keep_alive=keep_alive, options=options
+        )
+
+    combined_analysis = []
+    for i, result in enumerate(results, 1):
+        if isinstance(result, Exception):
+            logger.error("Błąd analizy części %d: %s", i, result)
             combined_analysis.append(f"--- CZĘŚĆ {i} (BŁĄD) ---\n")
+        else:
+            combined_analysis.append(f"--- CZĘŚĆ {i} ---\n{result}")
 
     return "\n\n".join(combined_analysis)
 
@@ -208,25 +778,95 @@ Nie interpretuj przedwcześnie, nie pisz esejów. Interesują nas:
 - Cel/Temat (np. sprzedaż działki, remont drogi, sesja rady)
 Jeśli tekst to błąd OCR lub bełkot -> POMIŃ CAŁKOWICIE."""
 
-PROMPT_EXTRACTION = """Przeanalizuj poniższe wpisy BIP (w tym treść załączników).
+PROMPT_EXTRACTION = Template("""Przeanalizuj poniższe wpisy BIP (w tym treść załączników).
 Dla każdego wpisu, który zawiera konkretne informacje (inwestycje, prawo, finanse), wygeneruj obiekt JSON w liście.
 
 Format wyjściowy (tylko JSON, bez markdowna):
 [
-  {{
+  {
     "tytul": "Skrócony tytuł",
     "fakt": "Krótki opis co się dzieje (np. Przetarg na X)",
     "szczegoly": "Kluczowe dane: 200 tys. zł, działka 123/4, termin do 15.05",
     "zrodlo": "Nazwa źródła",
     "url": "Pełny link do wpisu (przepisany z wejścia)"
-  }}
+  }
 ]
 
 Jeśli wpis jest nieistotny lub błędem OCR -> nie dodawaj go do listy.
 
 WPISY:
-{tekst_wpisow}
-"""
+$tekst_wpisow
+""")
+
+
+def _pack_chunks(entries: list[BIPEntry], budget_tokens: int) -> tuple[list[list[BIPEntry]], dict[int, str]]:
+    """
+    Partie wpisów wypełniane po kolei do `budget_tokens` tokenów tekstu wpisów
+    (_entry_text, ~3 znaki na token jak w fit_num_ctx). Wpis większy niż budżet
+    trafia do osobnej partii – przy odrzuceniu przez serwer i tak zostanie podzielony.
+    Zwraca też teksty wpisów (klucz id(wpisu)) – prompty budowane są z nich bez ponownego formatowania.
+    """
+    batches: list[list[BIPEntry]] = []
+    texts: dict[int, str] = {}
+    current: list[BIPEntry] = []
+    used = 0
+    for e in entries:
+        texts[id(e)] = text = _entry_text(e)
+        tokens = len(text) // 3 + 1
+        if current and used + tokens > budget_tokens:
+            batches.append(current)
+            current, used = [], 0
+        current.append(e)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches, texts
+
+
+def _facts_memo_key(entry: BIPEntry, model: str, options: dict[str, Any] | None = None) -> str:
+    """Klucz faktów wpisu: pełna treść wpisu (z załącznikami), model, jego opcje i prompt ekstrakcji."""
+    data = orjson.dumps(
+        {
+            "entry": entry.to_payload(),
+            "model": model,
+            "options": options or {},
+            "prompt": (SYSTEM_EXTRACTION, PROMPT_EXTRACTION.template),
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _parse_facts(text: str) -> list[dict] | None:
+    """Lista faktów z odpowiedzi ekstraktora (JSON, także w bloku ```json); None, gdy to nie lista obiektów."""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        facts = orjson.loads(text[start : end + 1])
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(facts, list) or not all(isinstance(f, dict) for f in facts):
+        return None
+    return facts
+
+
+def _memoize_facts(
+    memo: shelve.Shelf, batch: list[BIPEntry], result: str, model: str, options: dict[str, Any] | None
+) -> None:
+    """
+    Zapisuje fakty partii osobno dla każdego wpisu (po polu url). Partię, której
+    faktów nie da się jednoznacznie przypisać wpisom, pomijamy – zostanie wysłana ponownie.
+    """
+    facts = _parse_facts(result)
+    if facts is None:
+        return
+    urls = {e.url for e in batch}
+    if any(f.get("url") not in urls for f in facts):
+        return
+    for e in batch:
+        memo[_facts_memo_key(e, model, options)] = [f for f in facts if f.get("url") == e.url]
+
 
 def extract_facts(
     entries: list[BIPEntry],
@@ -234,41 +874,95 @@ def extract_facts(
     model: str = "mistral",
     timeout: int = 300,
     chunk_size: int = 5,
+    stride: int | None = None,
+    keep_alive: str | int = "30m",
+    memo_path: str | Path | None = None,
+    options: dict[str, Any] | None = None,
+    ctx_tokens: int | None = None,
+    errors: list[Exception] | None = None,
 ) -> str:
     """
     Etap 1: Ekstrakcja faktów.
     Korzysta z lekkiego modelu (Mistral/Llama) do wyciągnięcia konkretów z szumu OCR.
     Zwraca zagregowaną listę faktów (tekst JSON-like).
+    Partie idą równolegle (OLLAMA_NUM_PARALLEL, jak w analyze_for_residents).
+    `chunk_size` (w run.py: ollama.extractor_batch_size) to liczba wpisów na zapytanie;
+    partia odrzucona przez serwer (500) jest dzielona na pół i ponawiana.
+
+    Z `memo_path` fakty są zapamiętywane per wpis (shelve): do modelu trafiają tylko
+    wpisy nowe lub zmienione, a fakty pozostałych są dołączane z pamięci.
+    `options` – opcje modelu Ollamy (zob. ollama_generate).
+
+    Z `ctx_tokens` (okno kontekstu ekstraktora) partie nie mają stałej liczby wpisów:
+    _pack_chunks wypełnia każdą do ~80% okna minus prompt i zapas na odpowiedź,
+    więc przy dużym kontekście zapytań jest kilkukrotnie mniej (`chunk_size` i `stride` są wtedy pomijane).
+
+    Wyjątki nieudanych partii (ich fakty brakują w wyniku) trafiają do listy `errors`, gdy podana;
+    gdy nie udała się żadna wysłana partia – StageFailedError.
     """
-    batches = chunk_entries(entries, chunk_size)
-    combined_facts = []
-    
-    print(f"Ekstrakcja faktów w {len(batches)} częściach (model: {model})...")
+    memo = None
+    if memo_path:
+        Path(memo_path).parent.mkdir(parents=True, exist_ok=True)
+        memo = shelve.open(str(memo_path))
+    try:
+        cached_facts: list[dict] = []
+        todo = entries
+        if memo is not None:
+            todo = []
+            for e in entries:
+                facts = memo.get(_facts_memo_key(e, model, options))
+                if facts is None:
+                    todo.append(e)
+                else:
+                    cached_facts.extend(facts)
+            if len(todo) < len(entries):
+                logger.info("Fakty %d wpisów z poprzednich uruchomień, do ekstrakcji %d.", len(entries) - len(todo), len(todo))
 
-    for i, batch in enumerate(batches, 1):
-        print(f"  -> Ekstrakcja części {i}/{len(batches)}...")
-        tekst = entries_to_text(batch)
-        prompt = PROMPT_EXTRACTION.format(tekst_wpisow=tekst)
-        
-        try:
-            # Wymuszamy format JSON jeśli model to obsługuje, ale tekstowo też ok
-            response = ollama_generate(
-                base_url,
-                model,
-                prompt,
-                system=SYSTEM_EXTRACTION,
-                stream=False,
-                timeout=timeout,
-            )
-            combined_facts.append(response)
-        except Exception as e:
-            print(f"Błąd ekstrakcji części {i}: {e}")
+        texts = None
+        if ctx_tokens:
+            overhead = (len(SYSTEM_EXTRACTION) + len(PROMPT_EXTRACTION.template)) // 3
+            budget = int(0.8 * ctx_tokens) - overhead - _NUM_CTX_OUTPUT_RESERVE
+            batches, texts = _pack_chunks(todo, max(budget, 1))
+        else:
+            # Wszystko z pamięci – nie wysyłamy pustej partii
+            batches = chunk_entries(todo, chunk_size, stride) if todo or memo is None else []
+        logger.info("Ekstrakcja faktów w %d częściach (model: %s, równolegle %d)...", len(batches), model, _num_parallel())
+
+        batches, results = _generate_batches_adaptive(
+            batches,
+            PROMPT_EXTRACTION,
+            SYSTEM_EXTRACTION,
+            "Ekstrakcja",
+            warm_up=True,
+            texts=texts,
+            base_url=base_url,
+            model=model,
+            timeout=timeout,
+            keep_alive=keep_alive,
+            options=options,
+        )
+        # Same stare fakty z pamięci zamiast nowych wpisów to nie wynik – etap się nie udał
+        _raise_if_all_failed(results, "Ekstrakcja")
+        combined_facts = []
+        if memo is not None and (cached_facts or not todo):
+            combined_facts.append(orjson.dumps(cached_facts, option=orjson.OPT_INDENT_2).decode("utf-8"))
+        for i, (batch, result) in enumerate(zip(batches, results), 1):
+            if isinstance(result, Exception):
+                logger.error("Błąd ekstrakcji części %d: %s", i, result)
+                if errors is not None:
+                    errors.append(result)
+            else:
+                combined_facts.append(result)
+                if memo is not None:
+                    _memoize_facts(memo, batch, result, model, options)
+    finally:
+        if memo is not None:
+            memo.close()
 
-    
     if not combined_facts:
-        print("BŁĄD: Ekstrakcja faktów zakończyła się niepowodzeniem (pusta lista).", file=sys.stderr)
+        logger.error("Ekstrakcja faktów zakończyła się niepowodzeniem (pusta lista).")
         return ""
-        
+
     return "\n".join(combined_facts)
 
 
@@ -277,17 +971,141 @@ def generate_wordpress_article(
     base_url: str = "http://localhost:11434",
     model: str = "SpeakLeash/bielik-11b-v2.3-instruct:Q4_K_M",
     timeout: int = 300,
+    keep_alive: str | int = "30m",
+    options: dict[str, Any] | None = None,
 ) -> str:
     """
     Na podstawie wyniku analizy (lista wybranych wpisów + uzasadnienia)
     generuje artykuł WordPress (tytuł, lead, treść HTML).
     """
-    prompt = PROMPT_ARTYKUL.format(tekst_analizy=analysis_text)
+    prompt = PROMPT_ARTYKUL.substitute(tekst_analizy=analysis_text)
     return ollama_generate(
         base_url,
         model,
         prompt,
         system=SYSTEM_ARTYKUL,
-        stream=False,
         timeout=timeout,
+        keep_alive=keep_alive,
+        options=options,
+    )
+
+
+def generate_wordpress_article_stream(
+    analysis_text: str,
+    sink: TextIO,
+    base_url: str = "http://localhost:11434",
+    model: str = "SpeakLeash/bielik-11b-v2.3-instruct:Q4_K_M",
+    timeout: int = 300,
+    keep_alive: str | int = "30m",
+    options: dict[str, Any] | None = None,
+) -> None:
+    """
+    Jak generate_wordpress_article, ale artykuł jest zapisywany do `sink` na bieżąco,
+    w miarę generowania – bez trzymania całego tekstu w pamięci.
+    """
+    prompt = PROMPT_ARTYKUL.substitute(tekst_analizy=analysis_text)
+    ollama_generate(
+        base_url,
+        model,
+        prompt,
+        system=SYSTEM_ARTYKUL,
+        timeout=timeout,
+        keep_alive=keep_alive,
+        sink=sink,
+        options=options,
     )
+
+
+# Cache gotowych artykułów między uruchomieniami (cron): te same wpisy, modele i prompty
+# dają ten sam klucz, więc artykuł jest brany z pliku SQLite bez wywołania Ollamy.
+_ARTICLE_CACHE_PATH = Path(".cache") / "bip_llm.sqlite"
+
+
+def article_cache_key(entries: list[BIPEntry], **params: Any) -> str:
+    """
+    Klucz cache artykułu: wpisy (jak w payloadzie), parametry pipeline'u (modele, tryb)
+    oraz treść promptów – zmiana promptu unieważnia stare artykuły.
+    """
+    prompts = (
+        SYSTEM_ANALIZA, PROMPT_ANALIZA.template, SYSTEM_ARTYKUL, PROMPT_ARTYKUL.template,
+        SYSTEM_REDUKCJA, PROMPT_REDUKCJA.template, SYSTEM_EXTRACTION, PROMPT_EXTRACTION.template,
+    )
+    data = orjson.dumps(
+        {"entries": [e.to_payload() for e in entries], "params": params, "prompts": prompts},
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _article_db() -> sqlite3.Connection:
+    _ARTICLE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(_ARTICLE_CACHE_PATH, timeout=10)
+    db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, ts INTEGER NOT NULL)")
+    return db
+
+
+def get_cached_article(key: str, ttl: int) -> str | None:
+    """Artykuł zapisany pod kluczem nie dawniej niż ttl sekund temu; None przy braku lub błędzie cache."""
+    if ttl <= 0:
+        return None
+    try:
+        with closing(_article_db()) as db:
+            row = db.execute("SELECT value, ts FROM kv WHERE key = ?", (key,)).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Cache artykułów niedostępny: %s", e)
+        return None
+    if row is None or time.time() - row[1] >= ttl:
+        return None
+    return row[0].decode("utf-8")
+
+
+def store_article(key: str, article: str) -> None:
+    """Zapisuje artykuł pod kluczem; błędy zapisu tylko logujemy."""
+    try:
+        with closing(_article_db()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, ts) VALUES (?, ?, ?)",
+                (key, article.encode("utf-8"), int(time.time())),
+            )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Nie udało się zapisać artykułu w cache: %s", e)
+
+
+# Bezpiecznik (circuit breaker) między uruchomieniami z crona: po `threshold` kolejnych
+# nieudanych uruchomieniach Ollama jest pomijana, aż minie `cooldown` od ostatniej porażki
+# (wtedy jedno uruchomienie próbuje ponownie). Stan w .cache/ollama_breaker.json.
+_BREAKER_PATH = Path(".cache") / "ollama_breaker.json"
+
+
+def breaker_status(threshold: int, cooldown: int) -> tuple[int, float] | None:
+    """
+    Otwarty bezpiecznik: (liczba kolejnych porażek, sekundy do końca ochłonięcia) –
+    wtedy pomijamy Ollamę w tym uruchomieniu. None – można próbować (threshold <= 0 wyłącza).
+    """
+    if threshold <= 0:
+        return None
+    try:
+        state = orjson.loads(_BREAKER_PATH.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    failures = state.get("failures", 0)
+    remaining = cooldown - (time.time() - state.get("last_failure", 0))
+    if failures < threshold or remaining <= 0:
+        return None
+    return failures, remaining
+
+
+def record_ollama_run(ok: bool) -> None:
+    """Zapisuje wynik uruchomienia: sukces zeruje licznik porażek, porażka go zwiększa."""
+    try:
+        if ok:
+            _BREAKER_PATH.unlink(missing_ok=True)
+            return
+        try:
+            failures = orjson.loads(_BREAKER_PATH.read_bytes()).get("failures", 0)
+        except (OSError, orjson.JSONDecodeError):
+            failures = 0
+        _BREAKER_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _BREAKER_PATH.write_bytes(orjson.dumps({"failures": failures + 1, "last_failure": int(time.time())}))
+    except OSError as e:
+        logger.warning("Nie udało się zapisać stanu bezpiecznika Ollamy: %s", e)
@@ -2,23 +2,60 @@
 Scraper BIP: pobiera najnowsze zmiany i ogłoszenia z podanych adresów.
 Wspiera kanały RSS/Atom oraz fallback na skrapowanie HTML.
 """
+import codecs
+import functools
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
 import re
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import closing
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Iterator, Literal
 from urllib.parse import urljoin, urlparse
 
-import feedparser
+import orjson
 import requests
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup, NavigableString
+from bs4.dammit import UnicodeDammit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+# feedparser, pypdf, pdf2image i pytesseract są importowane w funkcjach, które ich używają:
+# uruchomienie bez PDF-ów (np. 304 z cache) nie płaci za ich ładowanie
 
+try:
+    # Przyrostowy parser JSON (backend yajl2_c) dla dużych odpowiedzi DataTables; opcjonalny, zapasem jest orjson
+    import ijson
+except ImportError:
+    ijson = None
 
-import io
-import sys
-import pytesseract
-from pdf2image import convert_from_bytes
-from pypdf import PdfReader
+try:
+    # Tesseract przez C API (bez procesu na stronę); opcjonalny, zapasem jest pytesseract
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    # MuPDF (C) – szybsza ekstrakcja tekstu z PDF; opcjonalny, zapasem jest pypdf
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(slots=True)
 class BIPEntry:
     """Pojedynczy wpis z BIP (ogłoszenie / aktualność)."""
     title: str
@@ -30,6 +67,10 @@ class BIPEntry:
     attachments: list[dict] = field(default_factory=list)
     raw: dict = field(default_factory=dict)
 
+    def __post_init__(self) -> None:
+        # Ta sama nazwa źródła we wszystkich wpisach – jedna kopia napisu w pamięci
+        self.source_name = sys.intern(self.source_name)
+
     def to_payload(self) -> dict:
         """Słownik gotowy do wysłania do agenta AI (np. pod artykuł WordPress)."""
         return {
@@ -42,14 +83,211 @@ class BIPEntry:
             "attachments": self.attachments,
         }
 
+    @classmethod
+    def from_payload(cls, payload: dict) -> "BIPEntry":
+        """Odtwarza wpis ze słownika z to_payload() (np. z cache na dysku)."""
+        return cls(
+            title=payload.get("title") or "",
+            url=payload.get("url") or "",
+            summary=payload.get("summary") or "",
+            content=payload.get("content") or "",
+            published=payload.get("published"),
+            source_name=payload.get("source_name") or "",
+            attachments=list(payload.get("attachments") or []),
+        )
+
+
+# Wspólna sesja HTTP – keep-alive między stroną listy, wpisami i załącznikami z tego samego BIP-u.
+# Pula większa niż liczba wątków, by równoległe pobrania nie czekały na wolne połączenie.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), raise_on_status=False),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
 
 def _fetch(
     url: str,
     timeout: int = 15,
     user_agent: str | None = None,
+    headers: dict | None = None,
+    stream: bool = False,
 ) -> requests.Response:
-    headers = {"User-Agent": user_agent or "BIP-Scraper/1.0 (Python)"}
-    return requests.get(url, timeout=timeout, headers=headers)
+    headers = {"User-Agent": user_agent or "BIP-Scraper/1.0 (Python)", **(headers or {})}
+    return _SESSION.get(url, timeout=timeout, headers=headers, stream=stream)
+
+
+# Cache stron list / kanałów między uruchomieniami (warunkowy GET: ETag / Last-Modified).
+# Przy 304 wpisy źródła są odtwarzane z dysku – bez pobierania i parsowania treści.
+_FEED_CACHE_PATH = Path(".cache") / "feeds.json"
+_feed_cache: dict[str, dict] | None = None
+_feed_cache_lock = threading.Lock()
+
+
+def _get_feed_cache() -> dict[str, dict]:
+    global _feed_cache
+    with _feed_cache_lock:
+        if _feed_cache is None:
+            try:
+                _feed_cache = json.loads(_FEED_CACHE_PATH.read_bytes())
+            except (OSError, ValueError):
+                _feed_cache = {}
+        return _feed_cache
+
+
+def save_feed_cache() -> None:
+    """Zapisuje cache list/kanałów na dysk (atomowo); wywoływane po zakończeniu scrapowania."""
+    with _feed_cache_lock:
+        if _feed_cache is None:
+            return
+        try:
+            _FEED_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=_FEED_CACHE_PATH.parent, delete=False, suffix=".tmp"
+            ) as f:
+                json.dump(_feed_cache, f, ensure_ascii=False)
+            os.replace(f.name, _FEED_CACHE_PATH)
+        except OSError as e:
+            logger.warning("Nie udało się zapisać cache list (%s)", e)
+
+
+_FEED_ITEM_TAGS = ("{*}item", "{*}entry")
+
+
+def _feed_date(value: str | None) -> str | None:
+    """Data z pubDate (RFC 822) albo updated/dc:date (ISO 8601) jako ISO 8601 w UTC – jak u feedparsera."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            dt = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return value
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+
+def _feed_link(el) -> str | None:
+    """Link z <link>: atrybut href (Atom, atom:link w RSS) z rel=alternate albo bez rel, inaczej tekst (RSS)."""
+    href = el.get("href")
+    if href is not None:
+        return href.strip() if el.get("rel", "alternate") == "alternate" else None
+    return (el.text or "").strip() or None
+
+
+def _feed_channel_link(parent) -> str | None:
+    """Link kanału wśród dzieci rodzica wpisów; w RSS 1.0 (RDF) wpisy są obok <channel>, nie w nim."""
+    for child in parent:
+        if not isinstance(child.tag, str):
+            continue
+        name = etree.QName(child).localname
+        if name == "link":
+            link = _feed_link(child)
+            if link:
+                return link
+        elif name == "channel":
+            link = _feed_channel_link(child)
+            if link:
+                return link
+    return None
+
+
+def _parse_feed_fast(content: bytes, max_entries: int) -> tuple[str | None, list[dict]]:
+    """
+    RSS 2.0/1.0 i Atom przez lxml.etree.iterparse: tylko pola używane w BIPEntry,
+    element wpisu czyszczony po odczycie, parsowanie kończy się po max_entries.
+    Zwraca (link kanału, wpisy); błąd XML (lxml.etree.XMLSyntaxError) przechodzi wyżej.
+    """
+    feed_link = None
+    items: list[dict] = []
+    if max_entries <= 0:
+        return feed_link, items
+    context = etree.iterparse(
+        io.BytesIO(content),
+        events=("end",),
+        tag=_FEED_ITEM_TAGS,
+        resolve_entities=False,
+        no_network=True,
+    )
+    for _, el in context:
+        if not items and el.getparent() is not None:
+            # Link kanału stoi przed wpisami – jest już w drzewie rodzica
+            feed_link = _feed_channel_link(el.getparent())
+        fields: dict[str, str] = {}
+        link = guid = None
+        permalink = False
+        for child in el:
+            if not isinstance(child.tag, str):
+                continue
+            name = etree.QName(child).localname
+            if name == "link":
+                link = link or _feed_link(child)
+            elif name in ("guid", "id"):
+                guid = (child.text or "").strip() or None
+                permalink = name == "guid" and child.get("isPermaLink", "true") != "false"
+            else:
+                # content:encoded (RSS) i content (Atom) pod jednym kluczem
+                key = "content" if name == "encoded" else name
+                if key not in fields:
+                    fields[key] = "".join(child.itertext()).strip()
+        if not link and permalink:
+            # RSS bez <link>: guid z isPermaLink jest adresem wpisu (jak w feedparserze)
+            link = guid
+        items.append({
+            "title": fields.get("title"),
+            "link": link,
+            "summary": fields.get("description") or fields.get("summary"),
+            "content": fields.get("content"),
+            "published": _feed_date(
+                fields.get("pubDate") or fields.get("published") or fields.get("updated") or fields.get("date")
+            ),
+            "id": guid,
+        })
+        el.clear()
+        if len(items) >= max_entries:
+            break
+    return feed_link, items
+
+
+def _parse_feed(resp: requests.Response, user_agent: str | None, max_entries: int) -> tuple[str | None, list[dict]]:
+    """Zapas dla kanałów, których lxml nie przyjmie (niepoprawny XML): tolerancyjny feedparser."""
+    # Import dopiero przy niepoprawnym kanale – zwykłe uruchomienie go nie potrzebuje
+    import feedparser
+
+    feed = feedparser.parse(
+        resp.content,
+        response_headers=dict(resp.headers),
+        request_headers={"User-Agent": user_agent or "BIP-Scraper/1.0"},
+    )
+    items: list[dict] = []
+    for e in feed.entries[:max_entries]:
+        content = e.get("content")
+        if isinstance(content, list):
+            content = content[0].get("value", "") if content else ""
+        published = None
+        for key in ("published", "updated"):
+            parsed = e.get(f"{key}_parsed")
+            if parsed:
+                try:
+                    published = datetime(*parsed[:6]).isoformat()
+                except (TypeError, IndexError):
+                    published = e.get(key, "")
+                break
+        items.append({
+            "title": e.get("title"),
+            "link": e.get("link"),
+            "summary": e.get("summary"),
+            "content": content,
+            "published": published,
+            "id": e.get("id"),
+        })
+    return feed.feed.get("link"), items
 
 
 def fetch_rss(
@@ -58,55 +296,53 @@ def fetch_rss(
     max_entries: int = 10,
     timeout: int = 15,
     user_agent: str | None = None,
+    resp: requests.Response | None = None,
 ) -> list[BIPEntry]:
-    """Pobiera wpisy z kanału RSS/Atom."""
-    resp = _fetch(rss_url, timeout=timeout, user_agent=user_agent)
-    resp.raise_for_status()
-    feed = feedparser.parse(
-        resp.content,
-        response_headers=dict(resp.headers),
-        request_headers={"User-Agent": user_agent or "BIP-Scraper/1.0"},
-    )
+    """Pobiera wpisy z kanału RSS/Atom (resp – gotowa odpowiedź, jeśli już pobrana)."""
+    if resp is None:
+        resp = _fetch(rss_url, timeout=timeout, user_agent=user_agent)
+        resp.raise_for_status()
+    try:
+        feed_link, items = _parse_feed_fast(resp.content, max_entries)
+    except etree.LxmlError as e:
+        logger.info("Kanał %s nie jest poprawnym XML (%s), używam feedparser", rss_url, e)
+        feed_link, items = _parse_feed(resp, user_agent, max_entries)
     entries: list[BIPEntry] = []
-    base_url = feed.feed.get("link") or rss_url
+    base_url = feed_link or rss_url
 
-    for i, e in enumerate(feed.entries):
-        if i >= max_entries:
-            break
-        link = e.get("link") or ""
+    for item in items:
+        link = item["link"] or ""
         if link and not link.startswith("http"):
             link = urljoin(base_url, link)
-        content = e.get("content") or e.get("summary") or ""
-        if isinstance(content, list):
-            content = content[0].get("value", "") if content else ""
-        elif hasattr(content, "value"):
-            content = getattr(content, "value", str(content))
-        published = None
-        if e.get("published_parsed"):
-            try:
-                published = datetime(*e.published_parsed[:6]).isoformat()
-            except (TypeError, IndexError):
-                published = e.get("published", "")
-        elif e.get("updated_parsed"):
-            try:
-                published = datetime(*e.updated_parsed[:6]).isoformat()
-            except (TypeError, IndexError):
-                published = e.get("updated", "")
+        summary = item["summary"] or ""
+        content = item["content"] or summary
 
         entries.append(
             BIPEntry(
-                title=e.get("title") or "(bez tytułu)",
+                title=item["title"] or "(bez tytułu)",
                 url=link,
-                summary=(e.get("summary") or "")[:500],
-                content=content or (e.get("summary") or ""),
-                published=published,
+                summary=summary[:500],
+                content=content,
+                published=item["published"],
                 source_name=source_name,
-                raw=dict(e),
+                # Tylko identyfikator – pełna kopia wpisu z parsera nie jest nigdzie czytana
+                raw={"rss_url": rss_url, "id": item["id"]},
             )
         )
     return entries
 
 
+def _list_base(list_url: str) -> tuple[str, str]:
+    """
+    Katalog strony listy (baza dla względnych linków) oraz 'scheme://host'.
+    Liczone raz na stronę, ze sparsowanej ścieżki – także dla adresów bez ścieżki
+    ('https://bip.gmina.pl' → 'https://bip.gmina.pl/').
+    """
+    parsed = urlparse(list_url)
+    scheme_host = f"{parsed.scheme}://{parsed.netloc}"
+    return f"{scheme_host}{parsed.path.rsplit('/', 1)[0]}/", scheme_host
+
+
 def _normalize_list_url(base: str, href: str) -> str:
     if not href or href.startswith("#"):
         return ""
@@ -115,42 +351,151 @@ def _normalize_list_url(base: str, href: str) -> str:
     return urljoin(base, href)
 
 
+# Daty w komórkach rejestru: '11/02/2026 - 14:42' oraz '10 lut 2026, 12:34' – jedna alternatywa,
+# jedno przeszukanie komórki zamiast dwóch
+_DATE_CELL_RE = re.compile(
+    r"\d{1,2}(?:[/.-]\d{1,2}[/.-]\d{4}|\s+(?:lut|sty|mar|kwi|maj|cze|lip|sie|wrz|paź|lis|gru)[a-z]*\s+\d{4})",
+    re.I,
+)
+# Data z godziną w blokach „Ostatnio dodane”
+_DATE_BLOCK_RE = re.compile(
+    r"\d{1,2}\s+(sty|lut|mar|kwi|maj|cze|lip|sie|wrz|paź|lis|gru)[a-z]*\s+\d{4}\s*,?\s*\d{1,2}:\d{2}",
+    re.I,
+)
+# Linki, które nie prowadzą do wpisów (skrypty, poczta, kotwice); w fallbacku także sam rejestr
+_BAD_URL_RE = re.compile(r"javascript:|mailto:|#", re.I)
+_BAD_FALLBACK_URL_RE = re.compile(r"javascript:|mailto:|#|rejestr-zmian", re.I)
+_JS_URL_RE = re.compile(r"javascript:", re.I)
+# Bloki „Ostatnio dodane” w rejestrach zmian (Drupal / układ Alfa)
+_REJESTR_BLOCK_SELECTOR = ".view-content .views-row, .node, .aktualnosc, [class*='last-added'], article, .item"
+# Adres danych DataTables w skrypcie inicjalizującym tabelę
+_AJAX_URL_RE = re.compile(r'"ajax":\s*"([^"]+)"')
+
+
+_CHARSET_RE = re.compile(r"""charset\s*=\s*["']?([\w.:-]+)""", re.I)
+
+
+def _declared_charset(resp: requests.Response) -> str | None:
+    """
+    Kodowanie jawnie podane w nagłówku Content-Type (None, gdy brak lub nieznane).
+    W odróżnieniu od resp.encoding bez domyślnego ISO-8859-1 requests dla text/*.
+    """
+    match = _CHARSET_RE.search(resp.headers.get("Content-Type", ""))
+    if not match:
+        return None
+    try:
+        return codecs.lookup(match.group(1)).name
+    except LookupError:
+        return None
+
+
+def _make_soup(markup: str | bytes, from_encoding: str | None = None) -> BeautifulSoup:
+    """
+    BeautifulSoup z parserem lxml (C); html.parser tylko gdy lxml odrzuci dokument.
+    from_encoding – kodowanie z nagłówka HTTP: BS4 próbuje go najpierw, bez zgadywania.
+    """
+    try:
+        return BeautifulSoup(markup, "lxml", from_encoding=from_encoding)
+    except Exception as e:
+        logger.debug("lxml odrzucił dokument (%s), używam html.parser", e)
+        return BeautifulSoup(markup, "html.parser", from_encoding=from_encoding)
+
+
+def _make_tree(content: bytes, encoding: str | None = None):
+    """
+    Drzewo lxml.html całego dokumentu (None dla pustej odpowiedzi). Kodowanie z nagłówka
+    HTTP (encoding), a bez niego wykrywane tak jak w BS4 (UnicodeDammit), żeby polskie
+    znaki wychodziły identycznie.
+    """
+    if not content.strip():
+        return None
+    if encoding is None:
+        encoding = UnicodeDammit(content, is_html=True).original_encoding
+    parser = lxml.html.HTMLParser(encoding=encoding) if encoding else None
+    return lxml.html.document_fromstring(content, parser=parser)
+
+
+def _fast_text(tag, separator: str | None = None) -> str:
+    """
+    Tekst elementu bez białych znaków na brzegach. Dla prostych elementów z jednym
+    węzłem tekstowym (typowy link) bierze .string zamiast przechodzić całe poddrzewo;
+    wynik jest taki sam jak get_text().strip() / get_text(separator, strip=True).
+    """
+    s = tag.string
+    if type(s) is NavigableString:
+        return s.strip()
+    if separator is None:
+        return tag.get_text().strip()
+    return tag.get_text(separator, strip=True)
+
+
 def _extract_date_from_cell(cell) -> str | None:
     """Wyciąga datę z tekstu komórki (np. 'śr., 11/02/2026 - 14:42' lub '10 lut 2026, 12:34')."""
     if not cell:
         return None
-    text = (cell.get_text() if hasattr(cell, "get_text") else str(cell)).strip()
+    text = _fast_text(cell) if hasattr(cell, "get_text") else str(cell).strip()
     if not text or len(text) > 60:
         return None
-    m = re.search(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})", text)
-    if m:
-        return text
-    m = re.search(r"(\d{1,2})\s+(lut|sty|mar|kwi|maj|cze|lip|sie|wrz|paź|lis|gru)[a-z]*\s+(\d{4})", text, re.I)
-    if m:
+    if _DATE_CELL_RE.search(text):
         return text
     return None
 
 
+# Ścieżki (prefiksy ijson) tablicy wierszy w odpowiedzi DataTables: nowy i stary format
+_AJAX_ROW_PREFIXES = ("data.item", "aaData.item")
+
+
+def _iter_ajax_rows(resp: requests.Response) -> Iterator:
+    """
+    Wiersze odpowiedzi DataTables ('data', a gdy brak – 'aaData'). Z ijson odpowiedź
+    (stream=True) jest parsowana przyrostowo bez budowania całego dokumentu; bez ijson – orjson.
+    """
+    if ijson is None:
+        data = orjson.loads(resp.content)
+        if "data" in data:
+            yield from data["data"]
+        elif "aaData" in data:
+            yield from data["aaData"]
+        return
+    # Surowy strumień z dekompresją gzip/deflate tak, jak robi to resp.content
+    resp.raw.decode_content = True
+    rows_prefix = None
+    builder = None
+    for prefix, event, value in ijson.parse(resp.raw, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == rows_prefix and event in ("end_map", "end_array"):
+                yield builder.value
+                builder = None
+        elif prefix in _AJAX_ROW_PREFIXES and (rows_prefix is None or prefix == rows_prefix):
+            rows_prefix = prefix
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                yield value
+
+
 def fetch_rejestr_zmian(
     list_url: str,
     source_name: str,
     max_entries: int = 25,
     timeout: int = 15,
     user_agent: str | None = None,
+    resp: requests.Response | None = None,
 ) -> list[BIPEntry]:
     """
     Pobiera wpisy z rejestru zmian BIP.
     Obsługuje: tabele (np. powiat kamienski, gmina wolin) oraz bloki „Ostatnio dodane”
     (np. BIP Dziwnów, Kamień Pomorski – układ Alfa).
+    resp – gotowa odpowiedź strony listy, jeśli już pobrana.
     """
-    resp = _fetch(list_url, timeout=timeout, user_agent=user_agent)
-    resp.raise_for_status()
-    resp.encoding = resp.apparent_encoding or "utf-8"
-    soup = BeautifulSoup(resp.text, "html.parser")
-    base_url = list_url.rsplit("/", 1)[0] + "/" if "/" in list_url else list_url + "/"
-    if not base_url.startswith("http"):
-        parsed = urlparse(list_url)
-        base_url = f"{parsed.scheme}://{parsed.netloc}/"
+    if resp is None:
+        resp = _fetch(list_url, timeout=timeout, user_agent=user_agent)
+        resp.raise_for_status()
+    # Bajty zamiast resp.text (bez kosztownego apparent_encoding): kodowanie z nagłówka, a gdy go brak – z meta charset
+    soup = _make_soup(resp.content, from_encoding=_declared_charset(resp))
+    base_url, scheme_host = _list_base(list_url)
     entries: list[BIPEntry] = []
     seen: set[str] = set()
 
@@ -171,150 +516,160 @@ def fetch_rejestr_zmian(
 
     if not tables or is_empty_table:
         # Try to find DataTables AJAX configuration
-        import re
-        import json
-        
         # Look for script containing .DataTable and ajax
         scripts = soup.find_all("script")
         ajax_url = None
         for script in scripts:
             if script.string and ".DataTable" in script.string and "ajax" in script.string:
-                match = re.search(r'"ajax":\s*"([^"]+)"', script.string)
+                match = _AJAX_URL_RE.search(script.string)
                 if match:
                     ajax_url = match.group(1)
                     break
         
         if ajax_url:
-            print(f"DEBUG: Found DataTables AJAX URL: {ajax_url}", file=sys.stderr)
+            logger.debug("Found DataTables AJAX URL: %s", ajax_url)
             # Construct full URL
             if ajax_url.startswith("/"):
-                from urllib.parse import urlparse
-                parsed_list_url = urlparse(list_url)
-                full_ajax_url = f"{parsed_list_url.scheme}://{parsed_list_url.netloc}{ajax_url}"
+                full_ajax_url = f"{scheme_host}{ajax_url}"
             else:
                 full_ajax_url = ajax_url # Assume absolute or relative to base?? Usually absolute path from root
             
             try:
                 # Fetch JSON
-                headers = {"User-Agent": user_agent} if user_agent else {}
-                headers["X-Requested-With"] = "XMLHttpRequest"
-                headers["Referer"] = list_url
-                
-                print(f"DEBUG: Fetching AJAX data from {full_ajax_url}", file=sys.stderr)
-                resp = requests.get(full_ajax_url, headers=headers, timeout=timeout)
-                resp.raise_for_status()
-                data = resp.json()
+                headers = {"X-Requested-With": "XMLHttpRequest", "Referer": list_url}
                 
-                rows = []
-                if 'data' in data:
-                    rows = data['data']
-                elif 'aaData' in data:
-                    rows = data['aaData']
+                logger.debug("Fetching AJAX data from %s", full_ajax_url)
+                # Przez wspólną sesję – ten sam host co strona rejestru, połączenie keep-alive jest już otwarte
+                with _fetch(full_ajax_url, timeout=timeout, user_agent=user_agent, headers=headers, stream=True) as resp:
+                    resp.raise_for_status()
+                    # Wiersze czytane strumieniowo – po max_entries reszta odpowiedzi nie jest dekodowana
+                    rows = _iter_ajax_rows(resp)
                 
-                for row in rows:
-                    if len(entries) >= max_entries:
-                        break
+                    for row in rows:
+                        if len(entries) >= max_entries:
+                            break
                     
-                    # Mapping based on observation of bip.gminawolin.pl / bip.dziwnow.pl
-                    # '0': Title (HTML or Text), '1': Module, '2': Type, '3': Date, '4': Author
-                    # Keys might be integers or strings of integers
+                        # Mapping based on observation of bip.gminawolin.pl / bip.dziwnow.pl
+                        # '0': Title (HTML or Text), '1': Module, '2': Type, '3': Date, '4': Author
+                        # Keys might be integers or strings of integers
                     
-                    raw_title = row.get('0') or row.get(0)
-                    date_str = row.get('3') or row.get(3) or ""
-                    author = row.get('4') or row.get(4) or ""
+                        raw_title = row.get('0') or row.get(0)
+                        date_str = row.get('3') or row.get(3) or ""
+                        author = row.get('4') or row.get(4) or ""
                     
-                    if raw_title:
-                        # Check for link in title
-                        title_soup = BeautifulSoup(str(raw_title), "html.parser")
-                        link = title_soup.find("a")
-                        if link and link.get("href"):
-                            title_text = link.get_text(strip=True)
-                            href = link.get("href").replace("\\", "/")
-                            if href.startswith("/"):
-                                parsed_list_url = urlparse(list_url)
-                                entry_url = f"{parsed_list_url.scheme}://{parsed_list_url.netloc}{href}"
+                        if raw_title:
+                            # Check for link in title
+                            title_soup = _make_soup(str(raw_title))
+                            link = title_soup.find("a")
+                            if link and link.get("href"):
+                                title_text = link.get_text(strip=True)
+                                href = link.get("href").replace("\\", "/")
+                                if href.startswith("/"):
+                                    entry_url = f"{scheme_host}{href}"
+                                else:
+                                    entry_url = href
                             else:
-                                entry_url = href
-                        else:
-                            title_text = title_soup.get_text(strip=True) or str(raw_title)
-                            entry_url = list_url # Fallback if no specific link
+                                title_text = title_soup.get_text(strip=True) or str(raw_title)
+                                entry_url = list_url # Fallback if no specific link
                         
-                        entry = BIPEntry(
-                            title=title_text,
-                            url=entry_url,
-                            published=str(date_str),
-                            source_name=source_name,
-                            summary=f"Data: {date_str}. Autor: {author}",
-                            content=f"Log: {title_text}. Autor: {author}. Data: {date_str}",
-                            attachments=[]
-                        )
-                        entries.append(entry)
+                            entry = BIPEntry(
+                                title=title_text,
+                                url=entry_url,
+                                published=str(date_str),
+                                source_name=source_name,
+                                summary=f"Data: {date_str}. Autor: {author}",
+                                content=f"Log: {title_text}. Autor: {author}. Data: {date_str}",
+                                attachments=[],
+                                raw={"list_url": list_url, "ajax_url": full_ajax_url},
+                            )
+                            entries.append(entry)
                 
                 if entries:
                     return entries
 
             except Exception as e:
-                print(f"ERROR fetching/parsing AJAX DataTables: {e}", file=sys.stderr)
+                logger.error("Error fetching/parsing AJAX DataTables: %s", e)
 
-    for table in tables:
-        for row in table.find_all("tr"):
-            cells = row.find_all(["td", "th"])
-            if not cells:
-                continue
-            link_el = row.find("a", href=True)
-            if not link_el:
-                continue
-            href = link_el.get("href", "").strip()
-            url = _normalize_list_url(base_url, href)
-            if not url or url in seen or any(x in url.lower() for x in ("javascript:", "mailto:", "#")):
-                continue
-            title = (link_el.get_text() or "").strip()
-            if len(title) < 5:
+    # Jedno przejście po linkach strony: każdy link trafia do koszyka według przodków
+    # (wiersz tabeli / blok „Ostatnio dodane” / główna treść), zamiast trzech osobnych przeszukań drzewa.
+    main = soup.find("main") or soup.find("article") or soup.find(id="content") or soup.body
+    block_ids = {id(b) for b in soup.select(_REJESTR_BLOCK_SELECTOR)}
+    row_links: list[tuple] = []    # (link, wiersz) – pierwszy link w wierszu tabeli
+    block_links: list[tuple] = []  # (link, blok) – pierwszy link w bloku
+    main_links: list = []
+    seen_containers: set[int] = set()
+    for link in soup.find_all("a", href=True):
+        row = None
+        outer_block = None
+        in_main = False
+        for parent in link.parents:
+            pid = id(parent)
+            if row is None and parent.name == "tr":
+                row = parent
+            if pid in block_ids and pid not in seen_containers:
+                # Zagnieżdżone bloki dzielą pierwszy link – datę bierzemy z zewnętrznego, jak przy select()
+                seen_containers.add(pid)
+                outer_block = parent
+            if parent is main:
+                in_main = True
+        if row is not None and id(row) not in seen_containers and row.find_parent("table") is not None:
+            seen_containers.add(id(row))
+            row_links.append((link, row))
+        if outer_block is not None:
+            block_links.append((link, outer_block))
+        if in_main:
+            main_links.append(link)
+
+    # 1) Tabela rejestru zmian (np. powiat kamienski: Zmieniono | Tytuł | Użytkownik | Informacja)
+    for link_el, row in row_links:
+        cells = row.find_all(["td", "th"])
+        if not cells:
+            continue
+        href = link_el.get("href", "").strip()
+        url = _normalize_list_url(base_url, href)
+        if not url or url in seen or _BAD_URL_RE.search(url):
+            continue
+        title = _fast_text(link_el)
+        if len(title) < 5:
+            continue
+        published = None
+        link_parents = {id(p) for p in link_el.parents}
+        for c in cells:
+            if id(c) in link_parents:
                 continue
-            published = None
-            for c in cells:
-                if link_el in c.find_all("a"):
-                    continue
-                d = _extract_date_from_cell(c)
-                if d:
-                    published = d
-                    break
-            seen.add(url)
-            entries.append(
-                BIPEntry(
-                    title=title,
-                    url=url,
-                    summary="",
-                    content="",
-                    published=published,
-                    source_name=source_name,
-                    raw={"list_url": list_url},
-                )
+            d = _extract_date_from_cell(c)
+            if d:
+                published = d
+                break
+        seen.add(url)
+        entries.append(
+            BIPEntry(
+                title=title,
+                url=url,
+                summary="",
+                content="",
+                published=published,
+                source_name=source_name,
+                raw={"list_url": list_url},
             )
-            if len(entries) >= max_entries:
-                return entries
+        )
+        if len(entries) >= max_entries:
+            return entries
 
     # 2) Bloki „Ostatnio dodane” (np. .view-content, .node, element z datą + nagłówkiem)
     if entries:
         return entries
-    date_pattern = re.compile(
-        r"\d{1,2}\s+(sty|lut|mar|kwi|maj|cze|lip|sie|wrz|paź|lis|lis|gru)[a-z]*\s+\d{4}\s*,?\s*\d{1,2}:\d{2}",
-        re.I,
-    )
-    for block in soup.select(".view-content .views-row, .node, .aktualnosc, [class*='last-added'], article, .item"):
-        link = block.find("a", href=True)
-        if not link:
-            continue
+    for link, block in block_links:
         href = link.get("href", "").strip()
         url = _normalize_list_url(base_url, href)
-        if not url or url in seen or "javascript:" in href.lower():
+        if not url or url in seen or _JS_URL_RE.search(href):
             continue
-        title = (link.get_text() or "").strip()
+        title = _fast_text(link)
         if len(title) < 5:
             continue
         published = None
         text = block.get_text() or ""
-        m = date_pattern.search(text)
+        m = _DATE_BLOCK_RE.search(text)
         if m:
             published = m.group(0).strip()
         seen.add(url)
@@ -333,81 +688,101 @@ def fetch_rejestr_zmian(
             return entries
 
     # 3) Fallback: dowolna lista linków w głównej treści (np. strona główna BIP)
-    main = soup.find("main") or soup.find("article") or soup.find(id="content") or soup.body
-    if main:
-        for link in main.find_all("a", href=True):
-            href = link.get("href", "").strip()
-            url = _normalize_list_url(base_url, href)
-            if not url or url in seen or any(x in url.lower() for x in ("javascript:", "mailto:", "#", "rejestr-zmian")):
-                continue
-            title = (link.get_text() or "").strip()
-            if len(title) < 10:  # wyższy próg dla fallbacku
-                continue
-            seen.add(url)
-            entries.append(
-                BIPEntry(
-                    title=title,
-                    url=url,
-                    summary="",
-                    content="",
-                    published=None,
-                    source_name=source_name,
-                    raw={"list_url": list_url},
-                )
+    for link in main_links:
+        href = link.get("href", "").strip()
+        url = _normalize_list_url(base_url, href)
+        if not url or url in seen or _BAD_FALLBACK_URL_RE.search(url):
+            continue
+        title = _fast_text(link)
+        if len(title) < 10:  # wyższy próg dla fallbacku
+            continue
+        seen.add(url)
+        entries.append(
+            BIPEntry(
+                title=title,
+                url=url,
+                summary="",
+                content="",
+                published=None,
+                source_name=source_name,
+                raw={"list_url": list_url},
             )
-            if len(entries) >= max_entries:
-                return entries
+        )
+        if len(entries) >= max_entries:
+            return entries
 
     return entries
 
 
+def _class_xpath(name: str) -> str:
+    """XPath odpowiednik selektora CSS .name (pełne słowo w atrybucie class)."""
+    return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+
+# Typowe kontenery wpisów na stronach BIP, w kolejności ważności (wcześniejsze trafienia
+# mają pierwszeństwo przy limicie max_entries). Odpowiedniki selektorów CSS:
+# article, .news-item, .ogloszenie, .aktualnosc, .komunikat, [class*='news'],
+# [class*='ogloszen'], .list-item, li a – skompilowane raz.
+_LIST_XPATHS = tuple(
+    etree.XPath(expr)
+    for expr in (
+        "//article",
+        _class_xpath("news-item"),
+        _class_xpath("ogloszenie"),
+        _class_xpath("aktualnosc"),
+        _class_xpath("komunikat"),
+        "//*[contains(@class, 'news')]",
+        "//*[contains(@class, 'ogloszen')]",
+        _class_xpath("list-item"),
+        "//li//a",
+    )
+)
+_FIRST_LINK_XPATH = etree.XPath("(.//a)[1]")
+
+
 def fetch_html_list(
     list_url: str,
     source_name: str,
     max_entries: int = 10,
     timeout: int = 15,
     user_agent: str | None = None,
+    resp: requests.Response | None = None,
 ) -> list[BIPEntry]:
     """
     Skrapuje stronę HTML w poszukiwaniu linków do ogłoszeń/aktualności.
     Szuka typowych elementów: .news-item, .ogloszenie, listy linków, artykuły.
+    resp – gotowa odpowiedź strony listy, jeśli już pobrana.
     """
-    resp = _fetch(list_url, timeout=timeout, user_agent=user_agent)
-    resp.raise_for_status()
-    resp.encoding = resp.apparent_encoding or "utf-8"
-    soup = BeautifulSoup(resp.text, "html.parser")
+    if resp is None:
+        resp = _fetch(list_url, timeout=timeout, user_agent=user_agent)
+        resp.raise_for_status()
+    # Bajty zamiast resp.text (bez apparent_encoding): kodowanie z nagłówka, a gdy go brak – z meta charset
+    tree = _make_tree(resp.content, _declared_charset(resp))
+    if tree is None:
+        return []
 
-    base = list_url.rsplit("/", 1)[0] + "/" if "/" in list_url else list_url + "/"
-    if not base.startswith("http"):
-        base = f"{urlparse(list_url).scheme}://{urlparse(list_url).netloc}/"
+    base, _ = _list_base(list_url)
 
     entries: list[BIPEntry] = []
     seen_urls: set[str] = set()
 
-    # Typowe selektory na stronach BIP
-    for selector in (
-        "article",
-        ".news-item",
-        ".ogloszenie",
-        ".aktualnosc",
-        ".komunikat",
-        "[class*='news']",
-        "[class*='ogloszen']",
-        ".list-item",
-        "li a",
-    ):
-        for el in soup.select(selector):
-            link = el if el.name == "a" else el.find("a")
-            if not link or not link.get("href"):
+    for xpath in _LIST_XPATHS:
+        for el in xpath(tree):
+            if el.tag == "a":
+                link = el
+            else:
+                found = _FIRST_LINK_XPATH(el)
+                link = found[0] if found else None
+            if link is None or not link.get("href"):
                 continue
             href = link.get("href", "").strip()
             url = _normalize_list_url(base, href)
             if not url or url in seen_urls:
                 continue
             # Odrzuć linki do samej strony, pliki PDF bez opisu itp.
-            if any(x in url.lower() for x in ("javascript:", "mailto:", "#")):
+            if _BAD_URL_RE.search(url):
                 continue
-            title = (link.get_text() or "").strip() or "(bez tytułu)"
+            title = link.text_content().strip() or "(bez tytułu)"
             if len(title) < 3:
                 continue
             seen_urls.add(url)
@@ -435,91 +810,455 @@ def fetch_source(
 ) -> list[BIPEntry]:
     """
     Pobiera wpisy z jednego źródła: RSS, rejestr zmian (rejestr_zmian: true)
-    albo zwykła lista HTML.
+    albo zwykła lista HTML. Jeśli serwer odpowie 304 na warunkowy GET,
+    zwraca wpisy zapamiętane przy poprzednim uruchomieniu.
     """
     name = source.get("name") or "BIP"
     max_entries = source.get("max_entries") or 10
+    url = source.get("rss_url") or source.get("list_url")
+    if not url:
+        return []
+
+    cache = _get_feed_cache()
+    cached = cache.get(url)
+    if cached and cached.get("source") != source:
+        cached = None
+    conditional = {}
+    if cached:
+        if cached.get("etag"):
+            conditional["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            conditional["If-Modified-Since"] = cached["last_modified"]
+    resp = _fetch(url, timeout=timeout, user_agent=user_agent, headers=conditional)
+    if resp.status_code == 304 and cached:
+        entries = [BIPEntry.from_payload(p) for p in cached["entries"]]
+        if cached.get("details"):
+            # Rekord zapisany już ze szczegółami (załączniki z tekstem PDF) – bez ponownego
+            # pobierania stron wpisów, PDF-ów i OCR
+            for e in entries:
+                e.raw["not_modified"] = True
+        else:
+            # Szczegóły poprzednio niepełne – pobierane od nowa, rekord znów współdzieli listy attachments
+            for e in entries:
+                e.attachments = []
+            with _feed_cache_lock:
+                cached["entries"] = [e.to_payload() for e in entries]
+        return entries
+    resp.raise_for_status()
 
     if source.get("rss_url"):
-        return fetch_rss(
-            source["rss_url"],
-            source_name=name,
-            max_entries=max_entries,
-            timeout=timeout,
-            user_agent=user_agent,
+        fetcher = fetch_rss
+    elif source.get("rejestr_zmian"):
+        fetcher = fetch_rejestr_zmian
+    else:
+        fetcher = fetch_html_list
+    entries = fetcher(
+        url,
+        source_name=name,
+        max_entries=max_entries,
+        timeout=timeout,
+        user_agent=user_agent,
+        resp=resp,
+    )
+
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    # Dane z AJAX (DataTables) zmieniają się niezależnie od strony-szkieletu – nie cache'ujemy
+    if (etag or last_modified) and not any("ajax_url" in e.raw for e in entries):
+        with _feed_cache_lock:
+            cache[url] = {
+                "source": source,
+                "etag": etag,
+                "last_modified": last_modified,
+                # Cache zapisywany jest po pobraniu szczegółów wpisów; to_payload() współdzieli
+                # listę attachments, więc rekord trafia na dysk razem z załącznikami.
+                # details ustawia _mark_details_fetched, gdy szczegóły wszystkich wpisów się udały
+                "details": False,
+                "entries": [e.to_payload() for e in entries],
+            }
+    elif cached:
+        with _feed_cache_lock:
+            cache.pop(url, None)
+    return entries
+
+
+# Minimalny tekst strony uznawanej za cyfrową; krótsza strona z obrazem idzie do OCR
+_OCR_MIN_PAGE_TEXT = 20
+
+
+def _pdf_pages_pymupdf(pdf_content: bytes, max_chars: int) -> list[tuple[str, bool]]:
+    """Tekst i obecność obrazu kolejnych stron przez MuPDF (C) – wielokrotnie szybciej niż pypdf."""
+    pages = []
+    total = 0
+    with pymupdf.open(stream=pdf_content, filetype="pdf") as doc:
+        for page in doc:
+            extracted = page.get_text().strip()
+            pages.append((extracted, bool(page.get_images())))
+            total += len(extracted)
+            if total >= max_chars:
+                break
+    return pages
+
+
+def _pdf_pages_pypdf(pdf_content: bytes, max_chars: int) -> list[tuple[str, bool]]:
+    """Tekst i obecność obrazu kolejnych stron przez pypdf (czysty Python) – zapas, gdy brak pymupdf."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(pdf_content))
+    pages = []
+    total = 0
+    for page in reader.pages:
+        extracted = page.extract_text() or ""
+        xobjects = (page.get("/Resources") or {}).get("/XObject")
+        # /Form może opakowywać obraz skanu – traktujemy jak obraz
+        has_image = bool(xobjects) and any(
+            x.get_object().get("/Subtype") in ("/Image", "/Form") for x in xobjects.get_object().values()
         )
-    if source.get("list_url"):
-        if source.get("rejestr_zmian"):
-            return fetch_rejestr_zmian(
-                source["list_url"],
-                source_name=name,
-                max_entries=max_entries,
-                timeout=timeout,
-                user_agent=user_agent,
-            )
-        return fetch_html_list(
-            source["list_url"],
-            source_name=name,
-            max_entries=max_entries,
+        pages.append((extracted, has_image))
+        total += len(extracted)
+        if total >= max_chars:
+            break
+    return pages
+
+
+# Opcjonalnie: lang='pol' lub 'pol+eng'
+_OCR_LANG = "pol+eng"
+# Rozdzielczość renderowania skanów – powyżej ~200 DPI jakość OCR druku już nie rośnie
+_OCR_DPI = 200
+# Strony renderowane i OCR-owane na partię (pytesseract: jedno uruchomienie tesseracta);
+# między partiami sprawdzany jest limit tekstu
+_OCR_BATCH_PAGES = 4
+# Tesseract jest jednowątkowy na obraz – równolegle najwyżej tyle procesów, ile rdzeni,
+# łącznie dla wszystkich PDF-ów pobieranych naraz
+_OCR_WORKERS = os.cpu_count() or 1
+_OCR_SLOTS = threading.BoundedSemaphore(_OCR_WORKERS)
+
+
+def _render_pages(pdf_path: str, first_page: int, last_page: int, output_folder: str | None = None) -> list:
+    """
+    Rasteryzacja zakresu stron przez pdftocairo (poppler). Z output_folder – ścieżki
+    do plików PNG (bez wczytywania obrazów do pamięci), inaczej obrazy PIL.
+    """
+    from pdf2image import convert_from_path
+
+    return convert_from_path(
+        pdf_path,
+        dpi=_OCR_DPI,
+        first_page=first_page,
+        last_page=last_page,
+        fmt="png",
+        use_pdftocairo=True,
+        output_folder=output_folder,
+        output_file=f"page_{first_page:04d}",
+        paths_only=output_folder is not None,
+    )
+
+
+def _ocr_batch(pdf_path: str, first_page: int, last_page: int, tmp: str) -> list[str]:
+    """Render partii stron do PNG i jedno uruchomienie tesseracta dla nich; tekst każdej strony osobno."""
+    import pytesseract
+
+    with _OCR_SLOTS:
+        paths = _render_pages(pdf_path, first_page, last_page, output_folder=tmp)
+        list_path = os.path.join(tmp, f"batch_{first_page:04d}.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(paths) + "\n")
+        # Tesseract kończy każdą stronę znakiem \f
+        texts = pytesseract.image_to_string(list_path, lang=_OCR_LANG).split("\f")
+    return (texts + [""] * len(paths))[:len(paths)]
+
+
+def _page_batches(pages: list[int]) -> list[tuple[int, int]]:
+    """Zakresy (first_page, last_page) z kolejnych numerów stron, najwyżej _OCR_BATCH_PAGES stron każdy."""
+    batches: list[tuple[int, int]] = []
+    for page in pages:
+        if batches and page == batches[-1][1] + 1 and page - batches[-1][0] < _OCR_BATCH_PAGES:
+            batches[-1] = (batches[-1][0], page)
+        else:
+            batches.append((page, page))
+    return batches
+
+
+def _ocr_pages(pdf_content: bytes, pages: list[int] | None = None) -> Iterator[tuple[int, str]]:
+    """
+    OCR wskazanych stron skanu (None – wszystkich), zwracane jako (numer strony, tekst)
+    w kolejności stron. PDF trafia raz do pliku tymczasowego, a każda partia stron jest
+    renderowana (first_page/last_page) dopiero, gdy jest potrzebna – gdy wywołujący
+    przestanie czytać (limit tekstu), dalsze strony nie są ani renderowane, ani OCR-owane.
+    Z tesserocr – jedna inicjalizacja Tesseracta na dokument, kolejna partia renderowana
+    w tle podczas OCR bieżącej; z pytesseract – partie (render + tesseract) równolegle,
+    fala po fali.
+    """
+    with tempfile.TemporaryDirectory(prefix="bip_ocr_") as tmp:
+        pdf_path = os.path.join(tmp, "document.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_content)
+        if pages is None:
+            from pdf2image import pdfinfo_from_path
+
+            pages = list(range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1))
+        batches = _page_batches(pages)
+        if not batches:
+            return
+
+        if tesserocr is not None:
+            # Jeden slot _OCR_SLOTS na cały dokument – łącznie najwyżej _OCR_WORKERS Tesseractów
+            with (
+                _OCR_SLOTS,
+                ThreadPoolExecutor(max_workers=1) as renderer,
+                tesserocr.PyTessBaseAPI(lang=_OCR_LANG) as api,
+            ):
+                pending = renderer.submit(_render_pages, pdf_path, *batches[0])
+                for i, (first_page, _) in enumerate(batches):
+                    images = pending.result()
+                    if i + 1 < len(batches):
+                        pending = renderer.submit(_render_pages, pdf_path, *batches[i + 1])
+                    for page, image in enumerate(images, first_page):
+                        api.SetImage(image)
+                        yield page, api.GetUTF8Text()
+            return
+
+        workers = max(1, min(_OCR_WORKERS, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for wave in range(0, len(batches), workers):
+                wave_batches = batches[wave:wave + workers]
+                for (first_page, _), texts in zip(
+                    wave_batches, pool.map(lambda batch: _ocr_batch(pdf_path, *batch, tmp), wave_batches)
+                ):
+                    yield from enumerate(texts, first_page)
+
+
+def _join_pages(texts: list[str], max_chars: int) -> str:
+    return "\n".join(t for t in texts if t).strip()[:max_chars]
+
+
+def extract_text_from_pdf(pdf_content: bytes, max_chars: int = 5000) -> str:
+    """
+    Ekstrakcja tekstu z PDF (pymupdf, gdy zainstalowany, inaczej pypdf), strona po stronie.
+    OCR (tesseract via pdf2image) tylko dla stron-skanów: z obrazem i bez warstwy tekstowej;
+    ich tekst trafia w miejsce danej strony. Dokumenty cyfrowe (także z pustą okładką)
+    nie idą do Tesseracta.
+    Zwraca co najwyżej max_chars znaków – kolejne strony nie są już przetwarzane.
+    """
+    pages = None
+    if pymupdf is not None:
+        try:
+            pages = _pdf_pages_pymupdf(pdf_content, max_chars)
+        except Exception as e:
+            logger.warning("Błąd pymupdf: %s", e)
+    if pages is None:
+        try:
+            pages = _pdf_pages_pypdf(pdf_content, max_chars)
+        except Exception as e:
+            logger.warning("Błąd pypdf: %s", e)
+
+    if pages is None:
+        # Nieczytelna struktura PDF – OCR wszystkich stron (poppler bywa bardziej tolerancyjny)
+        texts: list[str] = []
+        scan_pages = None
+    else:
+        texts = [text for text, _ in pages]
+        scan_pages = [
+            i for i, (text, has_image) in enumerate(pages, 1)
+            if has_image and len(text.strip()) < _OCR_MIN_PAGE_TEXT
+        ]
+        if not scan_pages:
+            return _join_pages(texts, max_chars)
+
+    logger.info("Strony bez tekstu w PDF (skan?), uruchamiam OCR (tesseract)...")
+    try:
+        # Konwersja stron PDF do obrazów wymaga poppler w systemie
+        # closing – przerwanie pętli od razu zatrzymuje render/OCR i sprząta katalog tymczasowy
+        with closing(_ocr_pages(pdf_content, scan_pages)) as ocr:
+            for page, ocr_text in ocr:
+                ocr_text = ocr_text.strip()
+                if page > len(texts):
+                    texts.append(ocr_text)
+                elif len(ocr_text) > len(texts[page - 1].strip()):
+                    texts[page - 1] = ocr_text
+                # Limit liczony na stronach do bieżącej włącznie – dalsze i tak zostałyby ucięte
+                if sum(len(t) for t in texts[:page]) >= max_chars:
+                    break
+    except Exception as e:
+        logger.warning("Błąd OCR: %s", e)
+        if not any(texts):
+            return f"[Błąd odczytu PDF i OCR: {str(e)}]"
+
+    return _join_pages(texts, max_chars)
+
+
+# Większe załączniki (zwykle skany) pomijamy – tekst i tak jest przycinany do kilku tys. znaków;
+# nadpisywane przez scraper.max_pdf_bytes w configu
+_DEFAULT_MAX_PDF_BYTES = 20 * 1024 * 1024
+# Maks. liczba znaków tekstu załącznika przekazywana dalej (do modelu)
+_ATTACHMENT_TEXT_LIMIT = 5000
+
+
+def _head(
+    url: str,
+    timeout: int = 15,
+    user_agent: str | None = None,
+) -> requests.Response | None:
+    """HEAD przez wspólną sesję (z przekierowaniami); None, gdy serwer nie obsługuje HEAD albo błąd."""
+    try:
+        resp = _SESSION.head(
+            url,
             timeout=timeout,
-            user_agent=user_agent,
+            headers={"User-Agent": user_agent or "BIP-Scraper/1.0 (Python)"},
+            allow_redirects=True,
         )
-    return []
+    except requests.RequestException:
+        return None
+    return resp if resp.ok else None
+
+
+_DOWNLOAD_CHUNK = 64 * 1024
+
+
+def _read_capped(resp: requests.Response, limit: int) -> bytes | None:
+    """Czyta strumieniowaną odpowiedź do limitu bajtów; None (i przerwanie pobierania) po przekroczeniu."""
+    size = int(resp.headers.get("Content-Length") or 0)
+    if size > limit:
+        return None
+    buf = bytearray()
+    for chunk in resp.iter_content(_DOWNLOAD_CHUNK):
+        buf += chunk
+        if len(buf) > limit:
+            return None
+    return bytes(buf)
+
+
+# Te same załączniki (wzory dokumentów) bywają linkowane z wielu wpisów – w obrębie
+# uruchomienia pobieramy i czytamy każdy PDF raz (klucz: URL, a wtórnie skrót treści)
+_PDF_CACHE_SIZE = 1024
+_pdf_text_by_hash: dict[bytes, str] = {}
+_pdf_text_lock = threading.Lock()
+
+
+def _pdf_text_cached(content: bytes) -> str:
+    """Tekst PDF-a (do limitu załącznika) z cache po SHA-256 treści – ten sam plik pod innym adresem."""
+    digest = hashlib.sha256(content).digest()
+    with _pdf_text_lock:
+        text = _pdf_text_by_hash.get(digest)
+    if text is None:
+        # +1 znak, by wiedzieć, czy coś ucięto
+        text = extract_text_from_pdf(content, max_chars=_ATTACHMENT_TEXT_LIMIT + 1)
+        with _pdf_text_lock:
+            if len(_pdf_text_by_hash) < _PDF_CACHE_SIZE:
+                _pdf_text_by_hash[digest] = text
+    return text
+
+
+@functools.lru_cache(maxsize=_PDF_CACHE_SIZE)
+def _fetch_pdf(
+    url: str,
+    timeout: int,
+    user_agent: str | None,
+    max_pdf_bytes: int,
+) -> tuple[str, int] | None:
+    """
+    Pobiera PDF i zwraca (tekst, rozmiar) albo None, gdy to nie PDF lub plik jest za duży.
+    Wynik zapamiętywany po URL-u; wyjątki (błędy sieci i HTTP) nie trafiają do cache.
+    """
+    # Najpierw HEAD: odrzucamy nie-PDF (także z końcówką .pdf w adresie) i zbyt duże pliki
+    # bez pobierania treści. Bez odpowiedzi na HEAD (405/501, błąd) – sprawdzamy dopiero po GET.
+    head = _head(url, timeout=timeout, user_agent=user_agent)
+    if head is not None:
+        content_type = head.headers.get("Content-Type", "").lower()
+        if content_type and "application/pdf" not in content_type:
+            return None
+        size = int(head.headers.get("Content-Length") or 0)
+        if size > max_pdf_bytes:
+            # Ucięty PDF jest nieczytelny (xref na końcu pliku), więc zamiast Range pomijamy plik
+            logger.info("Pomijam załącznik %s: %.1f MB", url, size / (1024 * 1024))
+            return None
+
+    # Ograniczenie: pobieramy tylko PDFy. Treść czytana strumieniowo – nagłówki sprawdzamy
+    # przed pobraniem ciała, a zbyt duży plik (bez HEAD/Content-Length) przerywamy w połowie.
+    with _fetch(url, timeout=timeout, user_agent=user_agent, stream=True) as file_resp:
+        # Błąd HTTP (także 5xx/429/403 po ponowieniach sesji) to wyjątek – nie trafia do cache,
+        # a załącznik zostanie pobrany ponownie; None tylko dla nie-PDF i zbyt dużych plików
+        if file_resp.status_code != 200:
+            file_resp.raise_for_status()
+        if "application/pdf" not in file_resp.headers.get("Content-Type", "").lower():
+            return None
+        content = _read_capped(file_resp, max_pdf_bytes)
+    if content is None:
+        logger.info("Pomijam załącznik %s: większy niż %.1f MB", url, max_pdf_bytes / (1024 * 1024))
+        return None
+    return _pdf_text_cached(content), len(content)
 
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    """Ekstrakcja tekstu z PDF (pypdf). Jeśli pusto, próba OCR (tesseract via pdf2image)."""
-    text = ""
+def _fetch_attachment(
+    url: str,
+    name: str,
+    timeout: int = 15,
+    user_agent: str | None = None,
+    max_pdf_bytes: int = _DEFAULT_MAX_PDF_BYTES,
+) -> dict | Literal[False] | None:
+    """
+    Pobiera jeden załącznik; zwraca słownik załącznika albo None, gdy to nie PDF lub plik jest za duży.
+    Błąd pobrania jest logowany, a wynikiem jest False (załącznik do ponowienia przy następnym uruchomieniu).
+    """
     try:
-        reader = PdfReader(io.BytesIO(pdf_content))
-        text_parts = []
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text_parts.append(extracted)
-        text = "\n".join(text_parts).strip()
+        pdf = _fetch_pdf(url, timeout, user_agent, max_pdf_bytes)
     except Exception as e:
-        print(f"Błąd pypdf: {e}", file=sys.stderr)
+        logger.warning("Błąd pobierania załącznika %s: %s", url, e)
+        return False
+    if pdf is None:
+        return None
+    raw_text, size = pdf
+    # Limit tekstu załącznika, żeby nie zapchać kontekstu
+    trimmed_text = raw_text[:_ATTACHMENT_TEXT_LIMIT] + ("..." if len(raw_text) > _ATTACHMENT_TEXT_LIMIT else "")
+    return {
+        "name": name,
+        "url": url,
+        "text_content": trimmed_text,
+        "size": size
+    }
 
-    # Fallback OCR jeśli tekstu jest bardzo mało (np. skan)
-    if len(text) < 50:
-        print("Mało tekstu w PDF (skan?), uruchamiam OCR (tesseract)...", file=sys.stderr)
-        try:
-            # Konwersja PDF do obrazów (wymaga poppler w systemie)
-            images = convert_from_bytes(pdf_content)
-            ocr_text = ""
-            for image in images:
-                # Opcjonalnie: lang='pol' lub 'pol+eng'
-                page_text = pytesseract.image_to_string(image, lang='pol+eng')
-                ocr_text += page_text + "\n"
-            
-            if len(ocr_text.strip()) > len(text):
-                 text = ocr_text
-        except Exception as e:
-            print(f"Błąd OCR: {e}", file=sys.stderr)
-            if not text:
-                return f"[Błąd odczytu PDF i OCR: {str(e)}]"
 
-    return text
+def _iter_anchors(content: bytes, encoding: str | None = None) -> Iterator[tuple[str, str, str | None]]:
+    """
+    Jedno przejście parserem lxml po linkach <a href> strony: (href, tekst, title).
+    Tekst jak get_text(" ", strip=True) w BS4.
+    """
+    tree = _make_tree(content, encoding)
+    if tree is None:
+        return
+    for el in tree.iter("a"):
+        href = el.get("href")
+        if href is None:
+            continue
+        text = " ".join(t for t in (s.strip() for s in el.itertext()) if t)
+        yield href, text, el.get("title")
+
+# Równoległe pobrania załączników jednego wpisu
+_ATTACHMENT_WORKERS = 8
+# Tekst linku sugerujący załącznik (sprawdzany na tekście już zamienionym na małe litery)
+_ATTACHMENT_TEXT_RE = re.compile(r"załącznik|zalacznik|pobierz|treść")
+_PDF_RE = re.compile(r"pdf", re.I)
 
 
 def fetch_entry_details(
     entry: BIPEntry,
     timeout: int = 15,
     user_agent: str | None = None,
-) -> None:
+    max_pdf_bytes: int = _DEFAULT_MAX_PDF_BYTES,
+) -> bool:
     """
     Wchodzi na stronę wpisu, szuka załączników (PDF), pobiera je i wyciąga tekst.
     Modyfikuje obiekt entry inplace (uzupełnia pole attachments).
+    Załączniki pobierane są równolegle; kolejność odpowiada kolejności linków na stronie.
+    Zwraca False, gdy strona wpisu lub któryś załącznik nie dał się pobrać (szczegóły niepełne).
     """
     # Jeśli to link bezpośrednio do pliku (rzadkie w BIP, ale możliwe w RSS), pomijamy deep scraping
     if entry.url.lower().endswith(".pdf"):
-        return
+        return True
 
     try:
         resp = _fetch(entry.url, timeout=timeout, user_agent=user_agent)
         resp.raise_for_status()
-        soup = BeautifulSoup(resp.content, "html.parser")
         base_url = entry.url
         
         # Szukamy linków do załączników
@@ -528,72 +1267,155 @@ def fetch_entry_details(
         # 2. treść linku zawiera "załącznik", "pobierz" itp.
         # 3. Klasa elementu sugeruje załącznik (np. 'att-link') - opcjonalnie
         
-        candidates = soup.find_all("a", href=True)
         unique_links = set()
+        to_fetch: list[tuple[str, str]] = []
         
-        for link_el in candidates:
-            href = link_el.get("href", "").strip()
-            text = link_el.get_text(" ", strip=True).lower()
+        for href, text, title in _iter_anchors(resp.content, _declared_charset(resp)):
+            href = href.strip()
+            text = text.lower()
             
             # Normalizacja URL
             full_url = urljoin(base_url, href)
             
-            is_pdf_ext = full_url.lower().endswith(".pdf")
-            is_attachment_text = any(kw in text for kw in ("załącznik", "zalacznik", "pobierz", "treść"))
+            is_pdf_ext = full_url[-4:].lower() == ".pdf"
+            is_attachment_text = _ATTACHMENT_TEXT_RE.search(text) is not None
             
             # Filtrujemy - musi być PDF lub jawnie nazwany załącznikiem (i prowadzić do pliku)
-            if not (is_pdf_ext or (is_attachment_text and "pdf" in href.lower())):
+            if not (is_pdf_ext or (is_attachment_text and _PDF_RE.search(href))):
                 continue
                 
             if full_url in unique_links:
                 continue
             unique_links.add(full_url)
-            
-            # Pobieramy plik
-            try:
-                # Ograniczenie: pobieramy tylko PDFy
-                # head first?
-                file_resp = _fetch(full_url, timeout=timeout, user_agent=user_agent)
-                if file_resp.status_code == 200 and "application/pdf" in file_resp.headers.get("Content-Type", "").lower():
-                    raw_text = extract_text_from_pdf(file_resp.content)
-                    # Limit tekstu załącznika, żeby nie zapchać kontekstu
-                    trimmed_text = raw_text[:5000] + ("..." if len(raw_text) > 5000 else "")
-                    
-                    entry.attachments.append({
-                        "name": text or link_el.get("title") or "Załącznik",
-                        "url": full_url,
-                        "text_content": trimmed_text,
-                        "size": len(file_resp.content)
-                    })
-            except Exception as e:
-                print(f"Błąd pobierania załącznika {full_url}: {e}", file=sys.stderr)
+            to_fetch.append((full_url, text or title or "Załącznik"))
+
+        if not to_fetch:
+            return True
+        with ThreadPoolExecutor(max_workers=min(_ATTACHMENT_WORKERS, len(to_fetch))) as pool:
+            results = list(pool.map(lambda item: _fetch_attachment(*item, timeout=timeout, user_agent=user_agent, max_pdf_bytes=max_pdf_bytes), to_fetch))
+        entry.attachments.extend(att for att in results if att)
+        return all(att is not False for att in results)
 
     except Exception as e:
-        print(f"Błąd fetch_entry_details dla {entry.url}: {e}", file=sys.stderr)
+        logger.warning("Błąd fetch_entry_details dla %s: %s", entry.url, e)
+        return False
 
 
-def run_scraper(config: dict) -> list[BIPEntry]:
-    """Uruchamia scraper dla wszystkich źródeł z configu."""
+# Domyślna liczba równoległych pobrań (źródła, strony wpisów) – praca jest I/O-bound;
+# nadpisywana przez scraper.concurrency w configu
+_DEFAULT_CONCURRENCY = 8
+
+
+def _fetch_source_safe(src: dict, timeout: int, user_agent: str | None) -> list[BIPEntry]:
+    """fetch_source z logowaniem błędu – jedno złe źródło nie przerywa całości."""
+    try:
+        entries = fetch_source(src, timeout=timeout, user_agent=user_agent)
+        logger.info("Pobieranie szczegółów dla źródła %s... (%d wpisów)", src.get("name"), len(entries))
+        return entries
+    except Exception as e:
+        # Loguj i idź dalej
+        logger.warning("Błąd źródła %s: %s", src.get("name", "?"), e)
+        return []
+
+
+def _fetch_details_safe(entry: BIPEntry, timeout: int, user_agent: str | None, max_pdf_bytes: int) -> bool:
+    try:
+        return fetch_entry_details(entry, timeout=timeout, user_agent=user_agent, max_pdf_bytes=max_pdf_bytes)
+    except Exception as err:
+        logger.warning("Błąd pobierania szczegółów %s: %s", entry.url, err)
+        return False
+
+
+def _mark_details_fetched(src: dict) -> None:
+    """Rekord cache list źródła oznaczany jako kompletny – po 304 szczegóły wpisów nie będą pobierane ponownie."""
+    url = src.get("rss_url") or src.get("list_url")
+    cache = _get_feed_cache()
+    with _feed_cache_lock:
+        record = cache.get(url) if url else None
+        if record is not None:
+            record["details"] = True
+
+
+def _needs_details(entries: list[BIPEntry]) -> list[BIPEntry]:
+    """Wpisy bez szczegółów – pomija odtworzone z cache po 304 (załączniki już są)."""
+    return [e for e in entries if not e.raw.get("not_modified")]
+
+
+def _fetch_source_worker(
+    args: tuple[dict, int, str | None, int, int],
+) -> tuple[list[BIPEntry], str | None, dict | None]:
+    """
+    Zadanie dla puli procesów: źródło razem ze szczegółami wpisów (wątki wewnątrz procesu).
+    Zwraca też rekord cache list – proces główny scala go i zapisuje, by procesy nie nadpisywały pliku.
+    """
+    src, timeout, user_agent, concurrency, max_pdf_bytes = args
+    entries = _fetch_source_safe(src, timeout, user_agent)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        fetched = list(pool.map(lambda e: _fetch_details_safe(e, timeout, user_agent, max_pdf_bytes), _needs_details(entries)))
+    if entries and all(fetched):
+        _mark_details_fetched(src)
+    url = src.get("rss_url") or src.get("list_url")
+    return entries, url, _get_feed_cache().get(url) if url else None
+
+
+def iter_scraper(config: dict) -> Iterator[BIPEntry]:
+    """
+    Jak run_scraper, ale oddaje wpisy źródło po źródle (w kolejności z configu),
+    gdy tylko dane źródło ma pobrane szczegóły wpisów.
+    Pobieranie jest potokowe: szczegóły wpisów źródła startują, gdy tylko przyjdzie
+    jego lista, równolegle z listami pozostałych źródeł (scraper.concurrency wątków).
+    Przy scraper.processes > 1 źródła rozdzielane są na procesy (ekstrakcja PDF/OCR
+    na wielu rdzeniach); domyślnie wszystko działa w wątkach jednego procesu.
+    """
     sources = config.get("sources") or []
     scraper_cfg = config.get("scraper") or {}
     timeout = scraper_cfg.get("request_timeout", 15)
     user_agent = scraper_cfg.get("user_agent")
+    concurrency = max(1, int(scraper_cfg.get("concurrency") or _DEFAULT_CONCURRENCY))
+    processes = int(scraper_cfg.get("processes") or 1)
+    max_pdf_bytes = int(scraper_cfg.get("max_pdf_bytes") or _DEFAULT_MAX_PDF_BYTES)
 
-    all_entries: list[BIPEntry] = []
-    for src in sources:
-        try:
-            entries = fetch_source(src, timeout=timeout, user_agent=user_agent)
-            
-            # Dla każdego wpisu pobieramy szczegóły (załączniki)
-            print(f"Pobieranie szczegółów dla źródła {src.get('name')}... ({len(entries)} wpisów)", file=sys.stderr)
-            for e in entries:
-                try:
-                    fetch_entry_details(e, timeout=timeout, user_agent=user_agent)
-                except Exception as err:
-                    print(f"Błąd pobierania szczegółów {e.url}: {err}", file=sys.stderr)
-            
-            all_entries.extend(entries)
-        except Exception as e:
-            # Loguj i idź dalej
-            print(f"Błąd źródła {src.get('name', '?')}: {e}", file=sys.stderr)
-    return all_entries
+    if processes > 1 and len(sources) > 1:
+        cache = _get_feed_cache()
+        # spawn: bez dziedziczenia wątków i otwartych połączeń sesji HTTP po fork()
+        with ProcessPoolExecutor(
+            max_workers=min(processes, len(sources)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as ex:
+            jobs = [(src, timeout, user_agent, concurrency, max_pdf_bytes) for src in sources]
+            for entries, url, record in ex.map(_fetch_source_worker, jobs, chunksize=1):
+                if url:
+                    with _feed_cache_lock:
+                        if record:
+                            cache[url] = record
+                        else:
+                            cache.pop(url, None)
+                yield from entries
+        save_feed_cache()
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+        def source_job(src: dict) -> tuple[list[BIPEntry], list[Future]]:
+            entries = _fetch_source_safe(src, timeout, user_agent)
+            # Dla każdego wpisu od razu zlecamy szczegóły (załączniki) – bez czekania na inne źródła
+            return entries, [
+                pool.submit(_fetch_details_safe, e, timeout, user_agent, max_pdf_bytes) for e in _needs_details(entries)
+            ]
+
+        for src, source_future in [(src, pool.submit(source_job, src)) for src in sources]:
+            entries, detail_futures = source_future.result()
+            wait(detail_futures)
+            if entries and all(f.result() for f in detail_futures):
+                _mark_details_fetched(src)
+            yield from entries
+    save_feed_cache()
+
+
+def run_scraper(config: dict) -> list[BIPEntry]:
+    """
+    Uruchamia scraper dla wszystkich źródeł z configu.
+    Źródła i strony wpisów pobierane są równolegle w puli wątków;
+    kolejność wyniku odpowiada kolejności źródeł w configu.
+    """
+    return list(iter_scraper(config))
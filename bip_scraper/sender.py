@@ -2,13 +2,30 @@
 Wysyłanie zebranych wpisów BIP do agenta AI (webhook/API).
 Payload jest przygotowany pod przerobienie na artykuł WordPress.
 """
-import json
+import gzip
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
 from typing import Any
 
+import orjson
 import requests
 
 from .scraper import BIPEntry
 
+# Odpowiedzi 4xx, po których wysyłkę warto ponowić (timeout żądania, limit zapytań)
+_RETRYABLE_4XX = (408, 429)
+
+
+class PayloadRejectedError(requests.exceptions.HTTPError):
+    """Agent odrzucił payload z kolejki na stałe (4xx poza 408/429); `dead_letter` – nowa ścieżka pliku."""
+
+    def __init__(self, *args: Any, dead_letter: Path, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.dead_letter = dead_letter
+
 
 def build_payload(entries: list[BIPEntry], instruction: str | None = None) -> dict:
     """
@@ -25,6 +42,14 @@ def build_payload(entries: list[BIPEntry], instruction: str | None = None) -> di
     return body
 
 
+def serialize_payload(entries: list[BIPEntry], instruction: str | None = None) -> bytes:
+    """
+    Payload jako bajty JSON (UTF-8 bez escapowania polskich znaków, wcięcie 2 spacje) –
+    jedna serializacja dla pliku, stdout i webhooka (post_payload).
+    """
+    return orjson.dumps(build_payload(entries, instruction=instruction), option=orjson.OPT_INDENT_2)
+
+
 def send_to_agent(
     entries: list[BIPEntry],
     webhook_url: str,
@@ -33,29 +58,116 @@ def send_to_agent(
     api_key_header: str = "Authorization",
     instruction: str | None = None,
     timeout: int = 30,
+    session: requests.Session | None = None,
 ) -> requests.Response:
     """
     Wysyła zebrane wpisy do agenta AI (POST JSON).
+    session – sesja wywołującego (pula połączeń keep-alive), domyślnie jednorazowe połączenie.
+    """
+    return post_payload(
+        orjson.dumps(build_payload(entries, instruction=instruction)),
+        webhook_url,
+        api_key=api_key,
+        api_key_header=api_key_header,
+        timeout=timeout,
+        session=session,
+    )
+
+
+def post_payload(
+    body: bytes,
+    webhook_url: str,
+    *,
+    api_key: str | None = None,
+    api_key_header: str = "Authorization",
+    timeout: int = 30,
+    session: requests.Session | None = None,
+    compress: bool = False,
+) -> requests.Response:
+    """
+    POST gotowego (zserializowanego) payloadu do agenta – wspólne dla send_to_agent i kolejki.
+    Z `compress` treść idzie jako gzip (Content-Encoding: gzip); agent odpowiadający
+    415 Unsupported Media Type dostaje ją ponownie bez kompresji.
     """
     if not webhook_url:
         raise ValueError("Brak webhook_url w konfiguracji agenta.")
-    payload = build_payload(entries, instruction=instruction)
     headers = {"Content-Type": "application/json; charset=utf-8"}
     if api_key and api_key_header:
         if api_key_header.lower() == "authorization" and not api_key.lower().startswith("bearer "):
             api_key = f"Bearer {api_key}"
         headers[api_key_header] = api_key
 
-    return requests.post(
+    http = session or requests
+    if compress:
+        # Powtarzalny polski tekst BIP kompresuje się kilkukrotnie
+        r = http.post(
+            webhook_url,
+            data=gzip.compress(body, compresslevel=6),
+            headers={**headers, "Content-Encoding": "gzip"},
+            timeout=timeout,
+        )
+        if r.status_code != 415:
+            return r
+    return http.post(
         webhook_url,
-        json=payload,
+        data=body,
         headers=headers,
         timeout=timeout,
     )
 
 
+def enqueue_payload(body: bytes, queue_dir: str | Path) -> Path:
+    """
+    Zapisuje zserializowany payload (serialize_payload) w kolejce wysyłki (queue_dir/<czas>-<uuid>.json, atomowo)
+    i zwraca ścieżkę. Plik jest usuwany dopiero po przyjęciu przez agenta (deliver_queued).
+    """
+    queue = Path(queue_dir)
+    queue.mkdir(parents=True, exist_ok=True)
+    # Czas w nazwie – kolejność zapisu także dla plików z tym samym mtime
+    path = queue / f"{time.time_ns()}-{uuid.uuid4().hex}.json"
+    with tempfile.NamedTemporaryFile("wb", dir=queue, suffix=".tmp", delete=False) as f:
+        f.write(body)
+    os.replace(f.name, path)
+    return path
+
+
+def pending_payloads(queue_dir: str | Path) -> list[Path]:
+    """Niewysłane payloady z kolejki, od najstarszego (odrzucone w queue_dir/failed/ są pomijane)."""
+    queue = Path(queue_dir)
+    if not queue.is_dir():
+        return []
+    return sorted(queue.glob("*.json"), key=lambda p: (p.stat().st_mtime_ns, p.name))
+
+
+def deliver_queued(path: Path, webhook_url: str, **kwargs: Any) -> requests.Response:
+    """
+    Wysyła payload z kolejki (kwargs jak w post_payload); po odpowiedzi 2xx usuwa plik.
+    Payload odrzucony na stałe (4xx poza 408/429) trafia do queue_dir/failed/ – PayloadRejectedError;
+    po innych błędach zostaje w kolejce do ponowienia.
+    """
+    r = post_payload(path.read_bytes(), webhook_url, **kwargs)
+    try:
+        r.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        if 400 <= r.status_code < 500 and r.status_code not in _RETRYABLE_4XX:
+            failed = path.parent / "failed"
+            failed.mkdir(exist_ok=True)
+            dead_letter = failed / path.name
+            os.replace(path, dead_letter)
+            raise PayloadRejectedError(str(e), response=r, dead_letter=dead_letter) from e
+        raise
+    path.unlink(missing_ok=True)
+    return r
+
+
 def save_payload_to_file(entries: list[BIPEntry], path: str, instruction: str | None = None) -> None:
     """Zapisuje payload do pliku JSON (np. do ręcznego przekazania agentowi)."""
-    payload = build_payload(entries, instruction=instruction)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    with open(path, "wb") as f:
+        f.write(serialize_payload(entries, instruction=instruction))
+
+
+def save_entries_snapshot(entries: list[BIPEntry], path: str) -> None:
+    """Zapisuje wpisy jako NDJSON (jeden wpis na linię) skompresowany gzipem – lokalny snapshot do debugowania."""
+    # Poziom 1: kilkukrotnie mniej bajtów niż wcięty JSON przy minimalnym koszcie CPU
+    with gzip.open(path, "wb", compresslevel=1) as f:
+        f.writelines(orjson.dumps(e.to_payload()) + b"\n" for e in entries)
@@ -13,31 +13,101 @@ Przykład crona (codziennie o 8:00, artykuł przez Bielika):
   0 8 * * * cd /ścieżka/do/bip-scraper && .venv/bin/python run.py --ollama -o artykul.html
 """
 import argparse
-import json
+import logging
+import os
 import sys
+import threading
+import time
 from pathlib import Path
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from types import SimpleNamespace
 
-import requests
-
-# Uruchom z katalogu projektu
-sys.path.insert(0, str(Path(__file__).resolve().parent))
+# Katalog skryptu (albo archiwum bip.pyz) jest już na sys.path – bip_scraper importuje się bez modyfikacji ścieżki
 
 from bip_scraper.config import load_config
 from bip_scraper.scraper import run_scraper
-from bip_scraper.sender import build_payload, save_payload_to_file, send_to_agent
-from bip_scraper.ollama_client import (
-    analyze_for_residents,
-    generate_wordpress_article,
-    extract_facts,
+from bip_scraper.sender import (
+    PayloadRejectedError,
+    deliver_queued,
+    enqueue_payload,
+    pending_payloads,
+    post_payload,
+    save_entries_snapshot,
+    serialize_payload,
 )
+# bip_scraper.ollama_client jest importowany dopiero w gałęzi --ollama (pozostałe tryby go nie ładują);
+# requests ładują już scraper i sender – lokalne `import requests` dają tylko dostęp do typów wyjątków
 
+log = logging.getLogger("bip")
 
-def main() -> int:
+
+class _TeeWriter:
+    """Zapisuje do strumienia i jednocześnie zbiera tekst (getvalue), jak io.StringIO."""
+
+    def __init__(self, stream) -> None:
+        self._stream = stream
+        self._parts: list[str] = []
+
+    def write(self, text: str) -> None:
+        self._stream.write(text)
+        self._stream.flush()
+        self._parts.append(text)
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
+
+
+# Domyślne wartości opcji – wspólne dla argparse i szybkiej ścieżki z crona
+_ARG_DEFAULTS = {
+    "config": "config.yaml",
+    "scrape_only": False,
+    "output": None,
+    "instruction": None,
+    "ollama": False,
+    "model_extractor": None,
+    "model_writer": None,
+    "snapshot_format": "ndjson",
+    "defer_webhook": False,
+    "preload_writer": True,
+}
+_FAST_FLAGS = {"--ollama": "ollama", "--scrape-only": "scrape_only"}
+_FAST_VALUE_OPTS = {"-o": "output", "--output": "output", "-c": "config", "--config": "config"}
+
+
+def _fast_parse_args(argv: list[str]) -> SimpleNamespace | None:
+    """
+    Typowe wywołania z crona (`--ollama`, `-o X`, `-c X`, `--scrape-only`) bez budowania
+    parsera argparse. None – coś spoza tej listy (także -h/--help): decyduje argparse.
+    """
+    if len(argv) > 3:
+        return None
+    args = SimpleNamespace(**_ARG_DEFAULTS)
+    it = iter(argv)
+    for arg in it:
+        if arg in _FAST_FLAGS:
+            setattr(args, _FAST_FLAGS[arg], True)
+        elif arg in _FAST_VALUE_OPTS:
+            value = next(it, None)
+            if value is None or (value.startswith("-") and value != "-"):
+                return None
+            setattr(args, _FAST_VALUE_OPTS[arg], value)
+        else:
+            return None
+    return args
+
+
+def _parse_args() -> argparse.Namespace | SimpleNamespace:
+    fast = _fast_parse_args(sys.argv[1:])
+    if fast is not None:
+        return fast
     parser = argparse.ArgumentParser(
-        description="BIP Scraper – rejestry zmian, analiza Bielik (Ollama), artykuł WordPress"
+        description="BIP Scraper – rejestry zmian, analiza Bielik (Ollama), artykuł WordPress",
+        epilog="Partie wpisów idą do Ollamy równolegle: OLLAMA_NUM_PARALLEL (lub ollama.num_parallel "
+        "w configu, domyślnie 4) jednoczesnych zapytań – najlepiej tyle samo, ile ustawiono serwerowi.",
     )
-    parser.add_argument("--config", "-c", default="config.yaml", help="Ścieżka do config.yaml")
+    parser.set_defaults(**_ARG_DEFAULTS)
+    parser.add_argument("--config", "-c", help="Ścieżka do config.yaml")
     parser.add_argument("--scrape-only", action="store_true", help="Tylko zbierz dane, wypisz JSON na stdout")
     parser.add_argument("--output", "-o", help="Zapisz wynik do pliku (JSON payload lub artykuł HTML przy --ollama)")
     parser.add_argument("--instruction", "-i", help="Dodatkowa instrukcja dla agenta AI (gdy bez --ollama)")
@@ -48,34 +118,123 @@ def main() -> int:
     )
     parser.add_argument("--model-extractor", help="Model do ekstrakcji faktów (np. mistral)")
     parser.add_argument("--model-writer", help="Model do pisania artykułu (np. SpeakLeash/bielik-11b-v2.3-instruct:Q4_K_M)")
-    args = parser.parse_args()
+    parser.add_argument(
+        "--snapshot-format",
+        choices=("ndjson", "json"),
+        help="Format lokalnego snapshotu wpisów: ndjson (bip_entries_<ts>.ndjson.gz, domyślnie) lub json (jak dawniej)",
+    )
+    parser.add_argument(
+        "--defer-webhook",
+        action="store_true",
+        help="Payload najpierw do kolejki (agent.queue_dir, domyślnie queue/), wysyłka w tle; "
+        "niewysłane payloady z poprzednich uruchomień są ponawiane w trakcie scrapowania",
+    )
+    parser.add_argument(
+        "--preload-writer",
+        action=argparse.BooleanOptionalAction,
+        help="Tryb dwuetapowy: ładuj model piszący w tle podczas ekstrakcji faktów (domyślnie tak; "
+        "wymaga stałego num_ctx w ollama.options; --no-preload-writer, gdy oba modele nie mieszczą się razem w pamięci)",
+    )
+    return parser.parse_args()
+
+
+def _agent_post_kwargs(agent: dict) -> dict:
+    """Parametry POST do agenta z config.agent (wspólne dla wysyłki bezpośredniej i z kolejki)."""
+    return {
+        "api_key": agent.get("api_key") or None,
+        "api_key_header": agent.get("api_key_header") or "Authorization",
+        "compress": bool(agent.get("compress", False)),
+    }
+
+
+def _model_options(ollama_cfg: dict, model: str) -> dict:
+    """Opcje Ollamy dla modelu: ollama.options nadpisane przez ollama.model_options.<model>."""
+    per_model = (ollama_cfg.get("model_options") or {}).get(model) or {}
+    return {**(ollama_cfg.get("options") or {}), **per_model}
+
+
+def _report_queued(path: Path, future: Future) -> None:
+    """Komunikat o wysyłce payloadu z kolejki; nieudany zostaje w kolejce do następnego uruchomienia."""
+    e = future.exception()
+    if e is None:
+        log.info("Wysłano do agenta payload z kolejki %s: %d.", path.name, future.result().status_code)
+    elif isinstance(e, PayloadRejectedError):
+        log.error("Agent odrzucił payload z kolejki %s – przeniesiony do %s: %s", path.name, e.dead_letter, e)
+    else:
+        log.error("Błąd wysyłki payloadu z kolejki %s (zostaje w kolejce): %s", path.name, e)
+
+
+def main() -> int:
+    args = _parse_args()
+    # Komunikaty (run.py, scraper, klient Ollamy) przez logging na stderr, bez prefiksów jak dawne printy
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    # Ponowienia urllib3 (Retry w sesji scrapera) – błąd i tak trafia do komunikatu źródła
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
 
     try:
         config = load_config(args.config)
     except FileNotFoundError as e:
-        print(str(e), file=sys.stderr)
+        log.error("%s", e)
         return 1
 
+    agent = config.get("agent") or {}
+    webhook_url = (agent.get("webhook_url") or "").strip()
+    queue_dir = Path(agent.get("queue_dir") or "queue")
+    sender_pool = None
+    if args.defer_webhook and webhook_url and not (args.ollama or args.scrape_only or args.output):
+        # Zaległe payloady (agent niedostępny w poprzednich uruchomieniach) wysyłane w tle podczas scrapowania;
+        # jeden wątek – agent dostaje je w kolejności zapisu, a nowy payload na końcu
+        sender_pool = ThreadPoolExecutor(max_workers=1)
+        for path in pending_payloads(queue_dir):
+            future = sender_pool.submit(deliver_queued, path, webhook_url, **_agent_post_kwargs(agent))
+            future.add_done_callback(partial(_report_queued, path))
+
     entries = run_scraper(config)
     if not entries:
-        print("Brak wpisów z BIP.", file=sys.stderr)
+        log.info("Brak wpisów z BIP.")
         return 0
 
-    print(f"Pobrano {len(entries)} wpisów z rejestrów zmian BIP.", file=sys.stderr)
+    log.info("Pobrano %d wpisów z rejestrów zmian BIP.", len(entries))
+
+    # Payload serializowany raz: snapshot JSON, stdout, plik i webhook dostają te same bajty
+    payload_bytes = None
+    if not args.ollama or args.snapshot_format == "json":
+        payload_bytes = serialize_payload(entries, instruction=args.instruction)
 
     # Zapisz snapshot pobranych wpisów lokalnie (timestamped), przydatne do debugowania
     try:
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        snapshot_path = Path(f"bip_entries_{ts}.json")
-        save_payload_to_file(entries, str(snapshot_path), instruction=args.instruction)
-        print(f"Zapisano lokalny snapshot: {snapshot_path}", file=sys.stderr)
+        ts = time.strftime("%Y%m%d_%H%M%S")
+        if args.snapshot_format == "json":
+            snapshot_path = Path(f"bip_entries_{ts}.json")
+            snapshot_path.write_bytes(payload_bytes)
+        else:
+            snapshot_path = Path(f"bip_entries_{ts}.ndjson.gz")
+            save_entries_snapshot(entries, str(snapshot_path))
+        log.info("Zapisano lokalny snapshot: %s", snapshot_path)
     except Exception as e:
-        print(f"Nie udało się zapisać snapshotu: {e}", file=sys.stderr)
+        log.warning("Nie udało się zapisać snapshotu: %s", e)
 
     # Tryb Ollama (Bielik): analiza → artykuł
     if args.ollama:
+        import requests
+        from bip_scraper.ollama_client import (
+            analyze_for_residents,
+            generate_wordpress_article_stream,
+            extract_facts,
+            close_session,
+            article_cache_key,
+            get_cached_article,
+            store_article,
+            warm_up_model,
+            breaker_status,
+            record_ollama_run,
+        )
+
         ollama_cfg = config.get("ollama") or {}
         base_url = ollama_cfg.get("base_url") or "http://localhost:11434"
+        # Zmienna środowiskowa ma pierwszeństwo przed configiem (jak przy serwerze Ollamy)
+        if ollama_cfg.get("num_parallel"):
+            os.environ.setdefault("OLLAMA_NUM_PARALLEL", str(ollama_cfg["num_parallel"]))
         
         # Default strategy: Single stage (Bielik only)
         # If --model-extractor is set, switch to Two-Stage (Extraction -> Synthesis)
@@ -83,76 +242,211 @@ def main() -> int:
         model_extractor = args.model_extractor or ollama_cfg.get("model_extractor")
         
         timeout = ollama_cfg.get("timeout") or 300
+        # Jak długo Ollama trzyma model (i cache promptu systemowego) w pamięci między wywołaniami/uruchomieniami
+        keep_alive = ollama_cfg.get("keep_alive") or "30m"
+        # Stałe opcje modeli (num_ctx, num_batch, num_predict, temperature...): ollama.options
+        # dla wszystkich, ollama.model_options.<model> nadpisuje je dla konkretnego modelu
+        writer_options = _model_options(ollama_cfg, model_writer)
+        extractor_options = _model_options(ollama_cfg, model_extractor) if model_extractor else {}
         out_path = args.output or "artykul.html"
+        # Partie ekstraktora: stała liczba wpisów (ollama.extractor_batch_size) albo – domyślnie –
+        # wypełniane do budżetu okna kontekstu modelu (options.num_ctx, bez niego 8192 tokenów)
+        extractor_batch_size = int(ollama_cfg.get("extractor_batch_size") or 0) or None
+        extractor_ctx = None if extractor_batch_size else int(extractor_options.get("num_ctx") or 8192)
 
+        # Te same wpisy, modele i prompty co w poprzednim uruchomieniu – artykuł z cache, bez Ollamy
+        cache_ttl = int(ollama_cfg.get("cache_ttl", 86400) or 0)
+        cache_key = article_cache_key(
+            entries,
+            model_writer=model_writer,
+            model_extractor=model_extractor,
+            tree_reduce=bool(ollama_cfg.get("tree_reduce")),
+            extractor_batch_size=extractor_batch_size,
+            extractor_ctx=extractor_ctx,
+            writer_options=writer_options,
+            extractor_options=extractor_options,
+        )
+        cached = get_cached_article(cache_key, cache_ttl)
+        if cached is not None:
+            log.info("Wpisy bez zmian od poprzedniego uruchomienia – artykuł z cache.")
+            if out_path == "-":
+                print(cached)
+            else:
+                Path(out_path).write_text(cached, encoding="utf-8")
+                log.info("Zapisano artykuł do %s.", out_path)
+            return 0
+
+        # Kilka kolejnych uruchomień bez działającej Ollamy – nie próbujemy do upływu breaker_cooldown
+        breaker_threshold = int(ollama_cfg.get("breaker_threshold", 3) or 0)
+        breaker_cooldown = int(ollama_cfg.get("breaker_cooldown", 3600) or 0)
+        breaker = breaker_status(breaker_threshold, breaker_cooldown)
+        if breaker is not None:
+            failures, remaining = breaker
+            log.warning(
+                "Ollama zawiodła w %d kolejnych uruchomieniach – pomijam, następna próba za %d min.",
+                failures,
+                max(1, round(remaining / 60)),
+            )
+            return 0
+
+        # Artykuł trafia na wyjście w miarę generowania; plik przez .part + rename,
+        # żeby przerwane generowanie nie nadpisało poprzedniego artykułu
+        part_path = None if out_path == "-" else Path(out_path).with_name(f".{Path(out_path).name}.part")
+        # Wyjątki nieudanych partii analizy/ekstrakcji – artykuł bez nich jest niepełny
+        stage_errors: list[Exception] = []
         try:
             if model_extractor:
                 # Two-Stage Pipeline
-                print(f"I ETAP: Ekstrakcja faktów (Model: {model_extractor})...", file=sys.stderr)
-                # Note: chunk_size=5 ensures we don't overload the extractor's context either, 
-                # although Mistral/Llama usually have 8k-128k context.
-                facts = extract_facts(entries, base_url=base_url, model=model_extractor, timeout=timeout)
-                
-                if not facts:
-                    print("Ekstrakcja faktów zwróciła pusty wynik. Przerywam.", file=sys.stderr)
+                log.info("I ETAP: Ekstrakcja faktów (Model: %s)...", model_extractor)
+                preload = None
+                if args.preload_writer and model_writer != model_extractor and writer_options.get("num_ctx"):
+                    # Ładowanie modelu piszącego (dysk → VRAM) w tle, równolegle z ekstrakcją.
+                    # Tylko z przypiętym num_ctx – bez niego kontekst zależy od długości faktów
+                    # i rozgrzany model zostałby przeładowany przy pierwszym zapytaniu
+                    preload = threading.Thread(
+                        target=warm_up_model,
+                        args=(base_url, model_writer),
+                        kwargs={"keep_alive": keep_alive, "timeout": timeout, "options": writer_options},
+                        daemon=True,
+                    )
+                    preload.start()
+                # Partie ekstraktora pakowane do okna kontekstu (albo po extractor_batch_size wpisów);
+                # partia za duża dla kontekstu modelu (500) jest automatycznie dzielona na pół
+                tekst_analizy = extract_facts(
+                    entries,
+                    base_url=base_url,
+                    model=model_extractor,
+                    timeout=timeout,
+                    chunk_size=extractor_batch_size or 5,
+                    ctx_tokens=extractor_ctx,
+                    keep_alive=keep_alive,
+                    options=extractor_options,
+                    errors=stage_errors,
+                    memo_path=Path(".cache") / "bip_facts" if ollama_cfg.get("facts_cache", True) else None,
+                )
+            
+                if not tekst_analizy:
+                    log.error("Ekstrakcja faktów zwróciła pusty wynik. Przerywam.")
+                    record_ollama_run(False)
                     return 1
 
-                print(f"II ETAP: Generowanie artykułu (Model: {model_writer})...", file=sys.stderr)
-                artykul = generate_wordpress_article(facts, base_url=base_url, model=model_writer, timeout=timeout)
+                log.info("II ETAP: Generowanie artykułu (Model: %s)...", model_writer)
+                if preload is not None:
+                    preload.join()
             else:
                 # Legacy Single Stage
-                print(f"Analiza jednoetapowa (Model: {model_writer})...", file=sys.stderr)
-                analiza = analyze_for_residents(entries, base_url=base_url, model=model_writer, timeout=timeout)
-                print("Generowanie artykułu WordPress...", file=sys.stderr)
-                artykul = generate_wordpress_article(analiza, base_url=base_url, model=model_writer, timeout=timeout)
-                
+                log.info("Analiza jednoetapowa (Model: %s)...", model_writer)
+                tekst_analizy = analyze_for_residents(
+                    entries,
+                    base_url=base_url,
+                    model=model_writer,
+                    timeout=timeout,
+                    tree_reduce=bool(ollama_cfg.get("tree_reduce")),
+                    keep_alive=keep_alive,
+                    options=writer_options,
+                    errors=stage_errors,
+                )
+                if not tekst_analizy:
+                    log.info("Brak wpisów istotnych dla mieszkańców – artykuł nie powstanie.")
+                    return 0
+                log.info("Generowanie artykułu WordPress...")
+
+            if part_path is None:
+                # Na stdout kopia tekstu tylko na potrzeby cache artykułów
+                sink = _TeeWriter(sys.stdout) if cache_ttl > 0 else sys.stdout
+                generate_wordpress_article_stream(
+                    tekst_analizy,
+                    sink,
+                    base_url=base_url,
+                    model=model_writer,
+                    timeout=timeout,
+                    keep_alive=keep_alive,
+                    options=writer_options,
+                )
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+            else:
+                with open(part_path, "w", encoding="utf-8") as f:
+                    generate_wordpress_article_stream(
+                        tekst_analizy,
+                        f,
+                        base_url=base_url,
+                        model=model_writer,
+                        timeout=timeout,
+                        keep_alive=keep_alive,
+                        options=writer_options,
+                    )
+                os.replace(part_path, out_path)
+                log.info("Zapisano artykuł do %s.", out_path)
+            
         except requests.exceptions.RequestException as e:
-            print(f"Błąd połączenia z Ollama ({base_url}): {e}", file=sys.stderr)
+            log.error("Błąd połączenia z Ollama (%s): %s", base_url, e)
             if getattr(e, "response") and e.response is not None and e.response.status_code == 404:
-                print("Endpoint nie znaleziony (404). Sprawdź: curl -s http://localhost:11434/api/tags", file=sys.stderr)
-                print("Jeśli port 11434 jest zajęty przez inną usługę, zatrzymaj ją i uruchom Ollamę (ollama serve).", file=sys.stderr)
+                log.error("Endpoint nie znaleziony (404). Sprawdź: curl -s http://localhost:11434/api/tags")
+                log.error("Jeśli port 11434 jest zajęty przez inną usługę, zatrzymaj ją i uruchom Ollamę (ollama serve).")
             else:
-                print("Upewnij się, że Ollama działa (ollama serve) i modele są pobrane.", file=sys.stderr)
+                log.error("Upewnij się, że Ollama działa (ollama serve) i modele są pobrane.")
+            record_ollama_run(False)
             return 1
-
-        if out_path == "-":
-            print(artykul)
-        else:
-            Path(out_path).write_text(artykul, encoding="utf-8")
-            print(f"Zapisano artykuł do {out_path}.", file=sys.stderr)
+        finally:
+            close_session()
+            if part_path is not None:
+                part_path.unlink(missing_ok=True)
+        if stage_errors:
+            # Niepełny artykuł nie trafia do cache (kolejne uruchomienie wygeneruje go ponownie)
+            # i nie zeruje licznika porażek bezpiecznika
+            log.warning(
+                "%d części nie powiodło się – artykuł jest niepełny, nie zapisuję go w cache.", len(stage_errors)
+            )
+            return 0
+        record_ollama_run(True)
+        if cache_ttl > 0:
+            store_article(cache_key, sink.getvalue() if part_path is None else Path(out_path).read_text(encoding="utf-8"))
         return 0
 
     if args.scrape_only:
-        payload = build_payload(entries, instruction=args.instruction)
-        json.dump(payload, sys.stdout, ensure_ascii=False, indent=2)
+        # Bajty prosto do bufora stdout: UTF-8 bez escapowania, wcięcie 2 spacje jak wcześniej
+        sys.stdout.flush()
+        sys.stdout.buffer.write(payload_bytes)
         return 0
 
     if args.output:
-        save_payload_to_file(entries, args.output, instruction=args.instruction)
-        print(f"Zapisano payload do {args.output}.", file=sys.stderr)
+        Path(args.output).write_bytes(payload_bytes)
+        log.info("Zapisano payload do %s.", args.output)
         return 0
 
-    agent = config.get("agent") or {}
-    webhook_url = (agent.get("webhook_url") or "").strip()
     if not webhook_url:
-        print("Brak webhook_url w config.agent – zapisuję do bip_output.json.", file=sys.stderr)
-        save_payload_to_file(entries, "bip_output.json", instruction=args.instruction)
+        log.warning("Brak webhook_url w config.agent – zapisuję do bip_output.json.")
+        Path("bip_output.json").write_bytes(payload_bytes)
+        return 0
+
+    import requests
+
+    if sender_pool is not None:
+        # Payload trafia najpierw do kolejki – przy błędzie agenta zostanie wysłany w kolejnym uruchomieniu
+        path = enqueue_payload(payload_bytes, queue_dir)
+        future = sender_pool.submit(deliver_queued, path, webhook_url, **_agent_post_kwargs(agent))
+        sender_pool.shutdown(wait=True)
+        try:
+            r = future.result()
+            log.info("Wysłano do agenta: %d.", r.status_code)
+        except PayloadRejectedError as e:
+            log.error("Agent odrzucił payload – przeniesiony do %s: %s", e.dead_letter, e)
+            log.error("%s", e.response.text[:500])
+            return 1
+        except requests.exceptions.RequestException as e:
+            log.error("Błąd wysyłki do agenta (payload zostaje w kolejce %s): %s", path, e)
+            return 1
         return 0
 
     try:
-        r = send_to_agent(
-            entries,
-            webhook_url,
-            api_key=agent.get("api_key") or None,
-            api_key_header=agent.get("api_key_header") or "Authorization",
-            instruction=args.instruction,
-        )
+        r = post_payload(payload_bytes, webhook_url, **_agent_post_kwargs(agent))
         r.raise_for_status()
-        print(f"Wysłano do agenta: {r.status_code}.", file=sys.stderr)
+        log.info("Wysłano do agenta: %d.", r.status_code)
     except requests.exceptions.RequestException as e:
-        print(f"Błąd wysyłki do agenta: {e}", file=sys.stderr)
+        log.error("Błąd wysyłki do agenta: %s", e)
         if getattr(e, "response") and e.response is not None:
-            print(e.response.text[:500], file=sys.stderr)
+            log.error("%s", e.response.text[:500])
         return 1
 
     return 0